@@ -0,0 +1,73 @@
+import os
+import time
+from threading import Lock
+
+# Stable (district, date) keys are checked less often: after every
+# STABLE_CHECKS unchanged checks in a row the key's interval doubles, up to
+# MAX_MULTIPLIER x the schedule-profile interval (and MAX_INTERVAL_SECONDS).
+# Any change drops it straight back to the profile interval, which is also
+# the upper bound on the check rate. Inside a schedule-profile window (slot
+# releases) keys are never backed off.
+ENABLED = os.environ.get("ADAPTIVE_POLLING", "true").lower() in ("1", "true", "yes")
+STABLE_CHECKS = int(os.environ.get("ADAPTIVE_STABLE_CHECKS", "3"))
+MAX_MULTIPLIER = int(os.environ.get("ADAPTIVE_MAX_MULTIPLIER", "8"))
+MAX_INTERVAL_SECONDS = float(os.environ.get("ADAPTIVE_MAX_INTERVAL_SECONDS", "1800"))
+
+class _KeyStats:
+    __slots__ = ("last_checked", "stable_streak")
+
+    def __init__(self):
+        self.last_checked = None
+        self.stable_streak = 0
+
+class AdaptivePoller:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self._keys = {}
+        self._lock = Lock()
+
+    def _multiplier(self, stats):
+        if not self.enabled:
+            return 1
+        return min(MAX_MULTIPLIER, 2 ** (stats.stable_streak // STABLE_CHECKS))
+
+    def interval_for(self, key, base_interval):
+        """Backed-off interval for a key - never shorter than base_interval"""
+        with self._lock:
+            stats = self._keys.get(key)
+            if stats is None:
+                return base_interval
+            backed_off = base_interval * self._multiplier(stats)
+            return max(base_interval, min(backed_off, MAX_INTERVAL_SECONDS))
+
+    def claim(self, key, base_interval, tolerance=1.0, force=False, backoff=True):
+        """
+        True (and marks the key checked) when the key is due for a check
+        backoff=False holds the key to base_interval (schedule windows)
+        """
+        interval = self.interval_for(key, base_interval) if backoff else base_interval
+        now = time.monotonic()
+        with self._lock:
+            stats = self._keys.setdefault(key, _KeyStats())
+            if not force and stats.last_checked is not None and now - stats.last_checked < interval * tolerance:
+                return False
+            stats.last_checked = now
+            return True
+
+    def record(self, key, changed):
+        """Outcome of a completed check"""
+        with self._lock:
+            stats = self._keys.setdefault(key, _KeyStats())
+            if changed:
+                stats.stable_streak = 0
+            else:
+                stats.stable_streak += 1
+
+    def prune(self, live_keys):
+        """Forget keys that are no longer checked (past dates)"""
+        live_keys = set(live_keys)
+        with self._lock:
+            for key in [k for k in self._keys if k not in live_keys]:
+                del self._keys[key]
+
+adaptive_poller = AdaptivePoller()
@@ -0,0 +1,234 @@
+"""
+Local stand-ins for the three services the checker talks to:
+
+  /iups-api/timeslots/{code}/{date}/false   timeslot API (configurable payloads)
+  /rest/v1/{table}, /rest/v1/rpc/{fn}       PostgREST subset used by supabase-py
+  /slack                                    Slack incoming webhook
+
+Everything runs in one ThreadingHTTPServer on 127.0.0.1.
+"""
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import urlsplit, parse_qs
+
+WAITING_ROOM_HTML = "<html><title>Online Waiting Room</title><body>Online Waiting Room</body></html>"
+
+class FakeConfig:
+    def __init__(
+        self,
+        slots_per_date=6,
+        latency_ms=50,
+        error_rate=0.0,
+        waiting_room_rate=0.0,
+        churn_rate=0.1,
+        supabase_latency_ms=20,
+        slack_latency_ms=30,
+        seed=1,
+    ):
+        self.slots_per_date = slots_per_date
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.waiting_room_rate = waiting_room_rate
+        self.churn_rate = churn_rate
+        self.supabase_latency_ms = supabase_latency_ms
+        self.slack_latency_ms = slack_latency_ms
+        self.seed = seed
+
+class FakeState:
+    """Shared between handler threads - counters, stored rows, payload versions"""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = Lock()
+        self.random = random.Random(config.seed)
+        self.counts = {}
+        self.rows_written = {}
+        self.tables = {}
+        self.slack_messages = []
+        self.versions = {}
+        # Keys that already served their waiting room page once
+        self.waiting_room_served = set()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def timeslot_payload(self, code, date):
+        """Deterministic per (code, date, version) so unchanged data is byte-identical"""
+        key = (code, date)
+        with self.lock:
+            if self.random.random() < self.config.churn_rate:
+                self.versions[key] = self.versions.get(key, 0) + 1
+            version = self.versions.get(key, 0)
+        rng = random.Random(f"{code}/{date}/{version}/{self.config.seed}")
+        slots = []
+        for i in range(self.config.slots_per_date):
+            capacity = rng.choice([0, 0, 1, 2, 5])
+            slots.append({
+                "name": f"{9 + i // 2:02d}:{(i % 2) * 30:02d}",
+                "capacity": capacity,
+                "vipCapacity": rng.choice([0, 1]),
+                "status": capacity > 0,
+            })
+        return json.dumps(slots)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": dict(self.counts),
+                "rows_written": dict(self.rows_written),
+                "slack_messages": len(self.slack_messages),
+            }
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json"):
+            data = body.encode() if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self):
+            # Always drain the body, otherwise it corrupts the next keep-alive request
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            self.body = json.loads(raw) if raw else None
+
+        def _sleep(self, ms):
+            if ms:
+                time.sleep(ms / 1000.0)
+
+        # ---------------- timeslot API ----------------
+        def _timeslots(self, parts):
+            state.count("timeslots")
+            self._sleep(state.config.latency_ms)
+            # /iups-api/timeslots/{code}/{date}/false
+            code, date = parts[2], parts[3]
+            if state.roll(state.config.error_rate):
+                state.count("timeslots_error")
+                return self._send(503, "Service Unavailable", "text/plain")
+            key = (code, date)
+            if key not in state.waiting_room_served and state.roll(state.config.waiting_room_rate):
+                # Only once per key, so the waiting room worker's retry gets through
+                with state.lock:
+                    state.waiting_room_served.add(key)
+                state.count("timeslots_waiting_room")
+                return self._send(200, WAITING_ROOM_HTML, "text/html")
+            return self._send(200, state.timeslot_payload(code, date))
+
+        # ---------------- PostgREST ----------------
+        def _postgrest(self, method, parts):
+            self._sleep(state.config.supabase_latency_ms)
+            # /rest/v1/{table} or /rest/v1/rpc/{fn}
+            if parts[2] == "rpc":
+                state.count("supabase_rpc")
+                return self._send(404, json.dumps({
+                    "code": "PGRST202",
+                    "message": f"Could not find the function public.{parts[3]}",
+                    "details": None,
+                    "hint": None,
+                }))
+            table = parts[2]
+            state.count(f"supabase_{method.lower()}")
+            if method == "GET":
+                with state.lock:
+                    rows = list(state.tables.get(table, []))
+                query = parse_qs(urlsplit(self.path).query)
+                date_filter = query.get("date", [""])[0]
+                if date_filter.startswith("in.("):
+                    dates = set(date_filter[4:-1].split(","))
+                    rows = [row for row in rows if str(row.get("date")) in dates]
+                return self._send(200, json.dumps(rows))
+            if method in ("POST", "PATCH"):
+                rows = self.body or []
+                if isinstance(rows, dict):
+                    rows = [rows]
+                with state.lock:
+                    stored = state.tables.setdefault(table, [])
+                    for row in rows:
+                        stored.append(dict(row, id=len(stored) + 1))
+                    state.rows_written[table] = state.rows_written.get(table, 0) + len(rows)
+                return self._send(201, json.dumps(rows))
+            if method == "DELETE":
+                return self._send(200, "[]")
+            return self._send(405, "[]")
+
+        # ---------------- Slack ----------------
+        def _slack(self):
+            state.count("slack")
+            self._sleep(state.config.slack_latency_ms)
+            payload = self.body or {}
+            with state.lock:
+                state.slack_messages.append(payload.get("text", ""))
+            return self._send(200, "ok", "text/plain")
+
+        def _route(self, method):
+            self._read_body()
+            parts = [p for p in urlsplit(self.path).path.split("/") if p]
+            if method == "GET" and len(parts) >= 5 and parts[:2] == ["iups-api", "timeslots"]:
+                return self._timeslots(parts)
+            if len(parts) >= 3 and parts[:2] == ["rest", "v1"]:
+                return self._postgrest(method, parts)
+            if method == "POST" and parts == ["slack"]:
+                return self._slack()
+            state.count("unknown")
+            return self._send(404, "{}")
+
+        def do_GET(self):
+            self._route("GET")
+
+        def do_POST(self):
+            self._route("POST")
+
+        def do_PATCH(self):
+            self._route("PATCH")
+
+        def do_DELETE(self):
+            self._route("DELETE")
+
+    return Handler
+
+class FakeServices:
+    """Start/stop the fakes and expose the URLs to point the checker at"""
+
+    def __init__(self, config=None):
+        self.state = FakeState(config or FakeConfig())
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self.state))
+        self.server.daemon_threads = True
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def timeslots_url(self):
+        return f"{self.base_url}/iups-api/timeslots"
+
+    @property
+    def slack_url(self):
+        return f"{self.base_url}/slack"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,157 @@
+"""
+Offline benchmark for the slot checker
+
+Runs jobs.check_passport_job and the waiting room worker against the local
+fakes in bench/fake_services.py and reports cycle time, request counts and
+memory. No network access or credentials needed:
+
+    python bench/run_bench.py --districts 12 --cycles 5 --latency-ms 80
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeConfig, FakeServices
+
+# Any well-formed JWT is accepted by supabase-py; the fake ignores it
+DUMMY_SUPABASE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYmVuY2gifQ.bench"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the slot checker against local fakes")
+    parser.add_argument("--districts", type=int, default=12, help="number of districts in the generated locations file")
+    parser.add_argument("--slots", type=int, default=6, help="slots per (district, date) payload")
+    parser.add_argument("--cycles", type=int, default=3, help="check cycles to run")
+    parser.add_argument("--latency-ms", type=float, default=50, help="timeslot API latency")
+    parser.add_argument("--supabase-latency-ms", type=float, default=20, help="PostgREST latency")
+    parser.add_argument("--slack-latency-ms", type=float, default=30, help="webhook latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of timeslot requests answered with 503")
+    parser.add_argument("--waiting-room-rate", type=float, default=0.0, help="share of keys that show the waiting room once")
+    parser.add_argument("--churn-rate", type=float, default=0.1, help="chance a (district, date) payload changes per request")
+    parser.add_argument("--max-rps", type=float, default=0, help="UPSTREAM_MAX_RPS for the run (0 = no rate cap)")
+    parser.add_argument("--concurrency", type=int, default=None, help="CHECK_CONCURRENCY for the run")
+    parser.add_argument("--storage", choices=["supabase", "sqlite", "memory"], default="supabase",
+                        help="SLOT_STORAGE_BACKEND (sqlite/memory take the database network out of the numbers)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the checker's own output")
+    parser.add_argument("--output", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+def configure_environment(args, services):
+    """Point the checker at the fakes - must run before importing utils/jobs"""
+    os.environ["SUPABASE_URL"] = services.base_url
+    os.environ["SUPABASE_KEY"] = DUMMY_SUPABASE_KEY
+    os.environ["SLACK_WEBHOOK"] = services.slack_url
+    os.environ["TIMESLOTS_BASE_URL"] = services.timeslots_url
+    os.environ["UPSTREAM_MAX_RPS"] = str(args.max_rps)
+    os.environ["SLOT_STORAGE_BACKEND"] = args.storage
+    os.environ["SLOT_SPOOL_DIR"] = tempfile.mkdtemp(prefix="bench-spool-")
+    if args.storage == "sqlite":
+        os.environ["SLOT_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "slots.db")
+    if args.concurrency:
+        os.environ["CHECK_CONCURRENCY"] = str(args.concurrency)
+
+def write_locations(count):
+    locations = {f"District {i:02d}": 100 + i for i in range(1, count + 1)}
+    handle = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump(locations, handle)
+    handle.close()
+    return handle.name
+
+def run(args):
+    config = FakeConfig(
+        slots_per_date=args.slots,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        waiting_room_rate=args.waiting_room_rate,
+        churn_rate=args.churn_rate,
+        supabase_latency_ms=args.supabase_latency_ms,
+        slack_latency_ms=args.slack_latency_ms,
+        seed=args.seed,
+    )
+    services = FakeServices(config).start()
+    configure_environment(args, services)
+    locations_file = write_locations(args.districts)
+    
+    import jobs
+    import waiting_room_handler
+    
+    import storage
+    
+    jobs.LOCATIONS_FILE = locations_file
+    output = sys.stdout if args.verbose else io.StringIO()
+    
+    # Clients are built lazily - build them up front so the first cycle
+    # measures the checker, not library imports
+    with contextlib.redirect_stdout(output):
+        storage.get_storage()
+        if args.storage == "supabase":
+            storage.get_supabase()
+    
+    cycle_times = []
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(output):
+            waiting_room_handler.start_waiting_room_worker()
+            for _ in range(args.cycles):
+                started = time.perf_counter()
+                jobs.check_passport_job(force=True)
+                cycle_times.append(time.perf_counter() - started)
+            worker_started = time.perf_counter()
+            worker_done = waiting_room_handler.waiting_room_queue.join(timeout=120)
+            worker_time = time.perf_counter() - worker_started
+            import utils
+            utils.flush_spool(timeout=120)
+            utils.flush_slack()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        services.stop()
+        os.unlink(locations_file)
+    
+    counts = services.state.snapshot()
+    lines = [
+        "Slot checker benchmark",
+        f"  districts={args.districts} slots={args.slots} cycles={args.cycles} "
+        f"latency={args.latency_ms}ms error_rate={args.error_rate} "
+        f"waiting_room_rate={args.waiting_room_rate} churn_rate={args.churn_rate}",
+        "",
+        "Cycle time (s)",
+        f"  first {cycle_times[0]:.3f} | min {min(cycle_times):.3f} | "
+        f"mean {statistics.mean(cycle_times):.3f} | max {max(cycle_times):.3f}",
+        f"  waiting room drain {worker_time:.3f}s ({'done' if worker_done else 'timed out'})",
+        "",
+        "Requests",
+    ]
+    for name, value in sorted(counts["requests"].items()):
+        lines.append(f"  {name:<24} {value}")
+    lines.append("")
+    lines.append("Rows written")
+    for name, value in sorted(counts["rows_written"].items()):
+        lines.append(f"  {name:<24} {value}")
+    lines.append("")
+    lines.append(f"Slack messages            {counts['slack_messages']}")
+    lines.append(f"Peak traced memory        {peak_memory / 1024:.0f} KiB")
+    lines.append("")
+    lines.append("Last cycle stages")
+    lines.append(jobs.last_pipeline_stats.summary())
+    
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    return report
+
+if __name__ == "__main__":
+    run(parse_args())
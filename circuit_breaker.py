@@ -0,0 +1,247 @@
+import os
+import random
+import socket
+import time
+from threading import Lock
+import requests
+from metrics import CIRCUIT_STATE, CIRCUIT_REJECTED
+
+try:
+    import httpx
+except ImportError:  # supabase brings httpx; keep working without it
+    httpx = None
+
+try:
+    from postgrest.exceptions import APIError
+except ImportError:
+    APIError = None
+
+# -------------------- Configuration --------------------
+# Consecutive transient failures that open a breaker
+FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# First open period; doubles (with jitter) every time a half-open probe fails
+RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "15"))
+MAX_RESET_SECONDS = float(os.environ.get("CIRCUIT_MAX_RESET_SECONDS", "300"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} circuit open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+# -------------------- Error classification --------------------
+# Postgres / PostgREST codes worth retrying: connection exceptions (08),
+# insufficient resources (53), operator intervention incl. statement timeout
+# (57), serialization failure / deadlock, PostgREST connection errors
+_TRANSIENT_DB_CODES = ("08", "53", "57", "40001", "40P01", "PGRST000", "PGRST001", "PGRST002", "PGRST003")
+
+def _is_transient_status(status):
+    return status == 429 or status >= 500
+
+def _error_code(error):
+    """
+    postgrest APIError code: a SQLSTATE / PGRST code, or the HTTP status
+    (int) when the response wasn't JSON; None when there is none
+    """
+    code = getattr(error, "code", None)
+    if code is None or code == "":
+        return None
+    return str(code)
+
+def _is_http_status(code):
+    # SQLSTATEs are five characters, HTTP statuses three digits
+    return len(code) == 3 and code.isdigit()
+
+def is_transient_error(error):
+    """
+    True for errors that say the dependency is unreachable or overloaded
+    (timeouts, connection failures, 5xx, 429); False for errors the
+    dependency answered with (bad request, missing table or function)
+    """
+    if isinstance(error, CircuitOpenError):
+        return True
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return _is_transient_status(error.response.status_code)
+    if httpx is not None:
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return _is_transient_status(error.response.status_code)
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout)):
+        return True
+    code = _error_code(error)
+    if code is None:
+        # A PostgREST error without any code came from a gateway, not the database
+        return isinstance(error, OSError) or (APIError is not None and isinstance(error, APIError))
+    if _is_http_status(code):
+        return _is_transient_status(int(code))
+    return code.startswith(_TRANSIENT_DB_CODES)
+
+# Codes that say the database refused the data itself: PostgREST schema
+# errors (PGRST2xx), data exceptions (22) and integrity violations (23)
+_DATA_REJECTION_CODES = ("PGRST2", "22", "23")
+
+def is_data_rejection(error):
+    """
+    True when the store answered that this particular write can never
+    succeed (4xx other than 429, schema mismatch, bad or conflicting data).
+    Anything else may succeed on a retry.
+    """
+    status = None
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+    elif httpx is not None and isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    if status is not None:
+        return 400 <= status < 500 and status != 429
+    code = _error_code(error)
+    if code is None:
+        return False
+    if _is_http_status(code):
+        return 400 <= int(code) < 500 and int(code) != 429
+    return code.startswith(_DATA_REJECTION_CODES)
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Exponential backoff with jitter: half the step fixed, half random"""
+    step = min(cap, base * 2 ** (attempt - 1))
+    return step / 2 + random.uniform(0, step / 2)
+
+# -------------------- Breaker --------------------
+class CircuitBreaker:
+    """
+    closed    - calls go through; FAILURE_THRESHOLD transient failures in a row open it
+    open      - calls are rejected until the reset period runs out
+    half_open - one probe call goes through; success closes, failure re-opens
+                with a longer (jittered) reset period
+    """
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD,
+                 reset_seconds=RESET_SECONDS, max_reset_seconds=MAX_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_reset_seconds = max_reset_seconds
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opens = 0
+        self._open_until = 0.0
+        self._probe_started = None
+        self._last_error = None
+        self._opened_at = None
+        CIRCUIT_STATE.set(0, dependency=name)
+
+    def _set_state(self, state):
+        if state != self._state:
+            print(f"🔌 {self.name} circuit {self._state} -> {state}")
+        self._state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], dependency=self.name)
+
+    def _open(self, now):
+        self._opens += 1
+        period = min(self.max_reset_seconds, self.reset_seconds * 2 ** (self._opens - 1))
+        self._open_until = now + period * random.uniform(0.8, 1.2)
+        self._opened_at = time.time()
+        self._probe_started = None
+        self._set_state(OPEN)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed (0 when calls go through)"""
+        with self._lock:
+            if self._state == CLOSED:
+                return 0.0
+            return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self):
+        """True when a call may go through; in half-open only one probe at a time"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if now < self._open_until:
+                    CIRCUIT_REJECTED.inc(dependency=self.name)
+                    return False
+                self._set_state(HALF_OPEN)
+            # A probe that never reported back frees its place after one reset period
+            if self._probe_started is not None and now - self._probe_started < self.reset_seconds:
+                CIRCUIT_REJECTED.inc(dependency=self.name)
+                return False
+            self._probe_started = now
+            return True
+
+    def check(self):
+        """allow() that raises CircuitOpenError instead of returning False"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opens = 0
+            self._probe_started = None
+            self._last_error = None
+            self._opened_at = None
+            self._set_state(CLOSED)
+
+    def record_failure(self, error=None):
+        now = time.monotonic()
+        with self._lock:
+            self._last_error = str(error)[:200] if error is not None else None
+            # Calls that started before the breaker opened don't extend the open period
+            if self._state == OPEN:
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open(now)
+
+    def record_error(self, error):
+        """
+        Count transient errors as failures; anything else (bad request,
+        or a local error) says nothing about the dependency's health and only
+        frees the half-open probe
+        """
+        if is_transient_error(error):
+            self.record_failure(error)
+        else:
+            with self._lock:
+                self._probe_started = None
+
+    def record_response(self, response):
+        """Count 5xx / 429 responses as failures"""
+        if _is_transient_status(response.status_code):
+            self.record_failure(f"HTTP {response.status_code}")
+        else:
+            self.record_success()
+
+    def to_dict(self):
+        with self._lock:
+            retry_in = 0.0 if self._state == CLOSED else max(0.0, self._open_until - time.monotonic())
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "retry_in": round(retry_in, 1),
+                "opened_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._opened_at)) if self._opened_at else None,
+                "last_error": self._last_error,
+            }
+
+# One breaker per external dependency
+timeslot_breaker = CircuitBreaker("timeslots")
+supabase_breaker = CircuitBreaker("supabase")
+slack_breaker = CircuitBreaker("slack")
+BREAKERS = {b.name: b for b in (timeslot_breaker, supabase_breaker, slack_breaker)}
+
+def breaker_states():
+    return {name: breaker.to_dict() for name, breaker in BREAKERS.items()}
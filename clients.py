@@ -0,0 +1,77 @@
+import os
+from threading import RLock
+
+ENV_FILE = os.environ.get("ENV_FILE", ".env.dev")
+
+_env_loaded = False
+
+def load_env():
+    """Load the .env file once (entry points call this before reading config)"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv(ENV_FILE)
+
+def require_env(name):
+    """Value of a required environment variable - raises when it is missing"""
+    load_env()
+    value = os.environ.get(name)
+    if not value:
+        raise ValueError(f"⚠️ {name} not set!")
+    return value
+
+class ClientRegistry:
+    """
+    Lazily built shared clients (Supabase, HTTP session, Slack sender)
+    Each module registers a factory; the client is only built on first
+    get(), so importing a module never connects or reads credentials.
+    set() injects a replacement (benchmarks, alternative backends).
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._closers = {}
+        self._instances = {}
+        self._lock = RLock()
+
+    def register(self, name, factory, close=None):
+        with self._lock:
+            self._factories[name] = factory
+            if close is not None:
+                self._closers[name] = close
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"No client registered as {name!r}")
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def set(self, name, instance):
+        """Use instance instead of building the client (None forgets it)"""
+        with self._lock:
+            if instance is None:
+                self._instances.pop(name, None)
+            else:
+                self._instances[name] = instance
+
+    def is_built(self, name):
+        return name in self._instances
+
+    def close(self, name):
+        """Close and forget a built client; the next get() builds a new one"""
+        with self._lock:
+            instance = self._instances.pop(name, None)
+            if instance is not None and name in self._closers:
+                self._closers[name](instance)
+
+clients = ClientRegistry()
@@ -0,0 +1,107 @@
+import os
+import time
+from threading import Lock
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from clients import clients
+
+# -------------------- Pool configuration --------------------
+# Number of per-host connection pools kept alive
+POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))
+# Connections kept open per host
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+# Block instead of opening extra connections once a host's pool is in use
+POOL_BLOCK = os.environ.get("HTTP_POOL_BLOCK", "true").lower() in ("1", "true", "yes")
+
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "10"))
+
+def _parse_host_limits(value):
+    """Parse "host=4,other.host=2" into {"host": 4, "other.host": 2}"""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        host, size = item.split("=", 1)
+        try:
+            limits[host.strip()] = int(size)
+        except ValueError:
+            print(f"⚠️ Ignoring invalid HTTP_HOST_LIMITS entry: {item}")
+    return limits
+
+# Per-host connection caps, e.g. HTTP_HOST_LIMITS="emrtds.nepalpassport.gov.np=4,hooks.slack.com=2"
+HOST_LIMITS = _parse_host_limits(os.environ.get("HTTP_HOST_LIMITS"))
+
+# Ceiling on timeslot API requests per second, shared by the checker and the
+# waiting room worker so concurrency never raises upstream volume
+UPSTREAM_MAX_RPS = float(os.environ.get("UPSTREAM_MAX_RPS", "3"))
+
+class HostRateLimiter:
+    """
+    Spaces requests to the same host at least 1/rate seconds apart
+    reserve() books the next free slot and returns how long to wait, so it
+    works from threads (time.sleep) and coroutines (asyncio.sleep) alike
+    """
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_free = {}
+        self._lock = Lock()
+
+    def reserve(self, host):
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_free.get(host, 0.0))
+            self._next_free[host] = slot + self.interval
+            return slot - now
+
+    def wait(self, host):
+        """Blocking variant for thread callers"""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+rate_limiter = HostRateLimiter(UPSTREAM_MAX_RPS)
+
+def _build_session():
+    session = requests.Session()
+    
+    default_adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=POOL_BLOCK,
+    )
+    session.mount("https://", default_adapter)
+    session.mount("http://", default_adapter)
+    
+    # More specific prefixes win, so these override the defaults per host
+    for host, size in HOST_LIMITS.items():
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, pool_block=True)
+        session.mount(f"https://{host}/", adapter)
+        session.mount(f"http://{host}/", adapter)
+    
+    return session
+
+clients.register("http", _build_session, close=lambda session: session.close())
+
+def get_session():
+    """Shared keep-alive session used by the checker, worker and Slack"""
+    return clients.get("http")
+
+def close_session():
+    """Close pooled connections (app shutdown)"""
+    clients.close("http")
+
+def host_of(url):
+    return urlsplit(url).hostname or ""
+
+def get(url, **kwargs):
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().get(url, **kwargs)
+
+def post(url, **kwargs):
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().post(url, **kwargs)
@@ -1,28 +1,385 @@
 import json
+import os
+import asyncio
 import time
+import hashlib
+from threading import Lock
 import requests
+import http_client
 from datetime import datetime
 from utils import (
-    load_last_slots,
-    save_last_slots,
+    persist_available_slots,
     save_unavailable_slots, 
     send_slack,
-    slots_changed,
-    clean_old_slots,
-    HEADERS
+    HEADERS,
+    BULK_CHUNK_SIZE
 )
 from schedule_days import get_valid_dates
-from waiting_room_handler import add_to_waiting_room_queue
+from schedule_config import get_schedule_profile
+from adaptive_polling import adaptive_poller
+from circuit_breaker import timeslot_breaker, CircuitOpenError
+from slot_state import slot_state
+from slot_model import SlotSnapshot, EMPTY_SNAPSHOT, diff_snapshots
+from notifier import format_slot_changes
+from metrics import FETCH_SECONDS, FETCH_TOTAL, STAGE_SECONDS, QUEUE_DEPTH, CHECK_SKIPPED, ADAPTIVE_SKIPPED
+from waiting_room_handler import add_to_waiting_room_queue, start_waiting_room_cycle
 
 LOCATIONS_FILE = "locations.json"
+TIMESLOTS_BASE_URL = os.environ.get(
+    "TIMESLOTS_BASE_URL", "https://emrtds.nepalpassport.gov.np/iups-api/timeslots"
+)
+
+# Timeslot requests in flight at once (the per-host rate still applies)
+CHECK_CONCURRENCY = int(os.environ.get("CHECK_CONCURRENCY", "4"))
+
+# Cached timeslot responses are fully re-processed at least this often, so
+# append mode still refreshes last_checked for dates that never change
+CACHE_MAX_AGE_SECONDS = int(os.environ.get("TIMESLOT_CACHE_MAX_AGE_SECONDS", "1800"))
+
+class TimeslotCache:
+    """
+    Per-URL validators from the last processed timeslot response
+    Sends If-None-Match / If-Modified-Since when the server gave an ETag or
+    Last-Modified, and falls back to comparing a hash of the body
+    """
+
+    def __init__(self, max_age_seconds=CACHE_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self._entries = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh_entry(self, url):
+        entry = self._entries.get(url)
+        if entry and time.monotonic() - entry["stored_at"] < self.max_age_seconds:
+            return entry
+        return None
+
+    def conditional_headers(self, url):
+        """Validator headers to merge into the request headers"""
+        with self._lock:
+            entry = self._fresh_entry(url)
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_unchanged(self, url, response):
+        """True on 304 or when the body is byte-identical to the cached one"""
+        with self._lock:
+            entry = self._fresh_entry(url)
+            unchanged = bool(entry) and (
+                response.status_code == 304
+                or (
+                    response.status_code == 200
+                    and hashlib.blake2b(response.content, digest_size=16).digest() == entry["body_hash"]
+                )
+            )
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return unchanged
+
+    def remember(self, url, response):
+        """Store validators after the response was processed"""
+        with self._lock:
+            self._entries[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "body_hash": hashlib.blake2b(response.content, digest_size=16).digest(),
+                "stored_at": time.monotonic(),
+            }
+
+    def forget(self, url):
+        with self._lock:
+            self._entries.pop(url, None)
+
+timeslot_cache = TimeslotCache()
+
+# A district counts as due once this share of its profile interval has passed
+# (ticks don't land exactly on the interval)
+DUE_TOLERANCE = 0.9
+_district_last_checked = {}
+
+def _due_districts(locations, force=False):
+    """Districts whose schedule-profile interval has elapsed since their last check"""
+    profile = get_schedule_profile()
+    now = time.monotonic()
+    due = {}
+    for district_name, code in locations.items():
+        last = _district_last_checked.get(district_name)
+        interval = profile.interval_for(district_name)
+        if force or last is None or now - last >= interval * DUE_TOLERANCE:
+            due[district_name] = code
+            _district_last_checked[district_name] = now
+    return due
+
+# Max items waiting between two pipeline stages (backpressure)
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "32"))
+
+class PipelineStats:
+    """Per-stage counters for one check run: calls, total and max seconds"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+        if stage != "fetch":
+            STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def summary(self):
+        lines = []
+        for stage, entry in self.stages.items():
+            avg = entry["total"] / entry["count"] if entry["count"] else 0.0
+            lines.append(
+                f"   {stage:<8} {entry['count']:>4} calls | total {entry['total']:.2f}s | "
+                f"avg {avg * 1000:.0f}ms | max {entry['max'] * 1000:.0f}ms"
+            )
+        return "\n".join(lines)
+
+# Stats of the most recent run (read by diagnostics)
+last_pipeline_stats = PipelineStats()
+
+def _count_rows(slots_dict):
+    return sum(len(slots) for dates in slots_dict.values() for slots in dates.values())
 
-def check_passport_job():
+def _persist_batch(all_slots, changed, unavailable, diffs):
+    """Write one batch of results (runs in a worker thread)"""
+    persist_available_slots(all_slots, changed, diffs)
+    slot_state.update(changed)
+    if unavailable:
+        save_unavailable_slots(unavailable)
+
+async def _fetch(url):
+    """
+    Fetch one timeslot URL, waiting for the per-host rate first
+    Raises CircuitOpenError without a request while the API is failing
+    """
+    timeslot_breaker.check()
+    delay = http_client.rate_limiter.reserve(http_client.host_of(url))
+    if delay > 0:
+        await asyncio.sleep(delay)
+    request_headers = {**HEADERS, **timeslot_cache.conditional_headers(url)}
+    try:
+        response = await asyncio.to_thread(http_client.get, url, headers=request_headers)
+    except Exception as e:
+        timeslot_breaker.record_error(e)
+        raise
+    timeslot_breaker.record_response(response)
+    return response
+
+async def _check_date(index, district_name, code, date, stats):
     """
-    Main checker - ALWAYS saves to database (even if unchanged)
+    Fetch and parse one (district, date)
+    Returns (index, district, date, available, unavailable) or None when
+    there is nothing to diff (cached, waiting room, error, empty)
+    """
+    url = f"{TIMESLOTS_BASE_URL}/{code}/{date}/false"
+    
+    try:
+        started = time.perf_counter()
+        response = await _fetch(url)
+        elapsed = time.perf_counter() - started
+        stats.record("fetch", elapsed)
+        FETCH_SECONDS.observe(elapsed, district=district_name)
+        
+        # Same payload as last time - nothing to parse, diff or save
+        if timeslot_cache.is_unchanged(url, response):
+            print(f"✓ Unchanged (cached): {district_name} on {date}")
+            FETCH_TOTAL.inc(district=district_name, outcome="cached")
+            adaptive_poller.record((district_name, date), changed=False)
+            return None
+        
+        text = response.text
+        
+        # Waiting room - delegate to background
+        if "Online Waiting Room" in text:
+            print(f"⏸️  Waiting room: {district_name} on {date}")
+            timeslot_cache.forget(url)
+            FETCH_TOTAL.inc(district=district_name, outcome="waiting_room")
+            await asyncio.to_thread(add_to_waiting_room_queue, district_name, code, date, url)
+            return None
+        
+        if response.status_code != 200:
+            print(f"⚠️ Status {response.status_code}: {district_name} on {date}")
+            FETCH_TOTAL.inc(district=district_name, outcome="http_error")
+            return None
+        
+        started = time.perf_counter()
+        try:
+            slots = response.json()
+        except json.JSONDecodeError:
+            print(f"⚠️ JSON decode failed: {district_name} on {date}")
+            FETCH_TOTAL.inc(district=district_name, outcome="bad_json")
+            return None
+        finally:
+            stats.record("parse", time.perf_counter() - started)
+        
+        timeslot_cache.remember(url, response)
+        FETCH_TOTAL.inc(district=district_name, outcome="ok")
+        
+        if not isinstance(slots, list) or len(slots) == 0:
+            adaptive_poller.record((district_name, date), changed=False)
+            return None
+        
+        available = [s for s in slots if isinstance(s, dict) and s.get("status")]
+        unavailable = [s for s in slots if isinstance(s, dict) and not s.get("status")]
+        return index, district_name, date, available, unavailable
+    
+    except CircuitOpenError:
+        # Degraded cycle - skip the request, the breaker probes on its own
+        FETCH_TOTAL.inc(district=district_name, outcome="circuit_open")
+    except requests.exceptions.Timeout:
+        print(f"⏱️ Timeout: {district_name} on {date}")
+        FETCH_TOTAL.inc(district=district_name, outcome="timeout")
+    except Exception as e:
+        print(f"⚠️ Error: {district_name} on {date}: {e}")
+        FETCH_TOTAL.inc(district=district_name, outcome="error")
+    return None
+
+# -------------------- Pipeline stages --------------------
+# fetch workers -> diff_queue -> diff stage -> persist_queue -> persister
+#                                          \-> notify_queue  -> notifier
+# Queues are bounded, so a slow stage pushes back on the one feeding it.
+# Persistence and notification are independent consumers: a slow Supabase
+# only delays persistence, not detection or the Slack message.
+
+async def _fetch_stage(work_queue, diff_queue, stats):
+    while True:
+        try:
+            index, district_name, code, date = work_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        result = await _check_date(index, district_name, code, date, stats)
+        if result is not None:
+            await diff_queue.put(result)
+
+async def _diff_stage(diff_queue, persist_queue, notify_queue, stats):
+    # Results not yet handed to the persister - sent whenever a full bulk chunk is ready
+    current_run_slots = {}
+    changed_slots = {}
+    current_run_unavailable = {}
+    diffs = {}
+    
+    async def _hand_off():
+        nonlocal current_run_slots, changed_slots, current_run_unavailable, diffs
+        await persist_queue.put((current_run_slots, changed_slots, current_run_unavailable, diffs))
+        current_run_slots, changed_slots, current_run_unavailable, diffs = {}, {}, {}, {}
+    
+    while True:
+        result = await diff_queue.get()
+        QUEUE_DEPTH.set(diff_queue.qsize(), queue="diff")
+        if result is None:
+            break
+        index, district_name, date, available, unavailable = result
+        started = time.perf_counter()
+        
+        changed = False
+        try:
+            # ALWAYS store current available slots (even if unchanged)
+            if available:
+                current_run_slots.setdefault(district_name, {})[date] = available
+                
+                # Check if changed for NOTIFICATION purposes only
+                # (fingerprint comparison; the structured diff only when it differs)
+                current = SlotSnapshot.from_dicts(available)
+                diff = diff_snapshots(slot_state.get_snapshot(district_name, date), current)
+                if diff:
+                    # NEW or CHANGED slots - add to notification
+                    changed_slots.setdefault(district_name, {})[date] = current
+                    diffs[(district_name, date)] = diff
+                    await notify_queue.put((index, district_name, date, current, diff))
+                    changed = True
+                    print(f"🆕 NEW/CHANGED: {district_name} on {date} - {len(available)} slots")
+                else:
+                    print(f"✓ Unchanged: {district_name} on {date} - {len(available)} slots")
+            else:
+                # Everything booked - report the slots that disappeared
+                prev = slot_state.get_snapshot(district_name, date)
+                if prev:
+                    diff = diff_snapshots(prev, EMPTY_SNAPSHOT)
+                    changed_slots.setdefault(district_name, {})[date] = EMPTY_SNAPSHOT
+                    diffs[(district_name, date)] = diff
+                    await notify_queue.put((index, district_name, date, EMPTY_SNAPSHOT, diff))
+                    changed = True
+                    print(f"🚫 GONE: {district_name} on {date} - {len(prev)} slots no longer available")
+            
+            # Collect unavailable slots for the bulk save
+            if unavailable:
+                current_run_unavailable.setdefault(district_name, {})[date] = unavailable
+            
+            adaptive_poller.record((district_name, date), changed)
+        except Exception as e:
+            print(f"⚠️ Diff error: {district_name} on {date}: {e}")
+        
+        stats.record("diff", time.perf_counter() - started)
+        
+        if _count_rows(current_run_slots) + _count_rows(current_run_unavailable) >= BULK_CHUNK_SIZE:
+            await _hand_off()
+    
+    # Append mode saves everything (updates last_checked), incremental only the changes
+    await _hand_off()
+    await persist_queue.put(None)
+    await notify_queue.put(None)
+
+async def _persist_stage(persist_queue, stats):
+    while True:
+        batch = await persist_queue.get()
+        QUEUE_DEPTH.set(persist_queue.qsize(), queue="persist")
+        if batch is None:
+            return
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(_persist_batch, *batch)
+        except Exception as e:
+            print(f"❌ Persist stage error: {e}")
+        stats.record("persist", time.perf_counter() - started)
+
+async def _notify_stage(notify_queue, stats):
+    notification_results = []
+    while True:
+        item = await notify_queue.get()
+        QUEUE_DEPTH.set(notify_queue.qsize(), queue="notify")
+        if item is None:
+            break
+        index, district_name, date, current, diff = item
+        notification_results.append((index, format_slot_changes(district_name, date, diff, current)))
+    
+    # Send notifications ONLY for changed slots, in locations.json order
+    if notification_results:
+        started = time.perf_counter()
+        notification_results.sort()
+        final_msg = "🎉 *New/Changed Passport Slots*\n\n" + "\n\n".join(block for _, block in notification_results)
+        send_slack(final_msg, dedupe=False)
+        stats.record("notify", time.perf_counter() - started)
+        print(f"\n{final_msg}\n")
+    else:
+        print("ℹ️  No new or changed slots")
+
+async def check_passport_job_async(force=False):
+    """
+    Main checker - in append mode ALWAYS saves to database (even if unchanged),
+    in incremental mode only changed (district, date) keys are written
     Only sends Slack notifications when slots change
+
+    Runs as a pipeline: CHECK_CONCURRENCY fetch workers (UPSTREAM_MAX_RPS per
+    host) feed a diff stage, which feeds separate persist and notify stages
+    Only districts due per the schedule profile are checked unless force is set
     """
-    # Clean old data first
-    clean_old_slots()
+    global last_pipeline_stats
+    
+    start_waiting_room_cycle()
     
     try:
         with open(LOCATIONS_FILE, "r") as f:
@@ -31,102 +388,85 @@ def check_passport_job():
         print(f"Failed to load locations.json: {e}")
         return
     
-    valid_dates = get_valid_dates(days_ahead=7)
-    last_slots = load_last_slots()
-    
-    # For tracking what to notify about
-    notification_results = []
-    any_new_slots = False
+    valid_dates = get_valid_dates()
+    all_locations = locations
+    locations = _due_districts(all_locations, force)
+    if not locations:
+        print("ℹ️  No district due for a check yet")
+        return
+    await asyncio.to_thread(slot_state.ensure_loaded)
     
     print(f"\n{'='*60}")
     print(f"🔍 Starting slot check at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*60}")
+    if timeslot_breaker.state != "closed":
+        print(f"⛔ Timeslot API circuit {timeslot_breaker.state} - requests are skipped until a probe succeeds")
     
-    # Temporary storage for THIS run's results
-    current_run_slots = {}
+    stats = PipelineStats()
+    run_started = time.perf_counter()
     
+    # Stable (district, date) keys are backed off by the adaptive poller
+    profile = get_schedule_profile()
+    work_queue = asyncio.Queue()
+    skipped = 0
     for district_name, code in locations.items():
-        base_url = f"https://emrtds.nepalpassport.gov.np/iups-api/timeslots/{code}"
-        
+        base_interval = profile.interval_for(district_name)
+        # No backoff inside a window - that is when new slots are released
+        backoff = profile.window_for(district_name) is None
         for date in valid_dates:
-            url = f"{base_url}/{date}/false"
-            
-            try:
-                response = requests.get(url, headers=HEADERS, timeout=10)
-                text = response.text
-                
-                # Waiting room - delegate to background
-                if "Online Waiting Room" in text:
-                    print(f"⏸️  Waiting room: {district_name} on {date}")
-                    add_to_waiting_room_queue(district_name, code, date, url)
-                    continue
-                
-                if response.status_code != 200:
-                    print(f"⚠️ Status {response.status_code}: {district_name} on {date}")
-                    continue
-                
-                try:
-                    slots = response.json()
-                except json.JSONDecodeError:
-                    print(f"⚠️ JSON decode failed: {district_name} on {date}")
-                    continue
-                
-                if not isinstance(slots, list) or len(slots) == 0:
-                    continue
-                
-                # Process slots
-                available = [s for s in slots if isinstance(s, dict) and s.get("status")]
-                unavailable = [s for s in slots if isinstance(s, dict) and not s.get("status")]
-                
-                # ALWAYS store current available slots (even if unchanged)
-                if available:
-                    current_run_slots.setdefault(district_name, {})[date] = available
-                    
-                    # Check if changed for NOTIFICATION purposes only
-                    prev_available = last_slots.get(district_name, {}).get(date, [])
-                    if slots_changed(prev_available, available):
-                        # NEW or CHANGED slots - add to notification
-                        any_new_slots = True
-                        day_block = [f"📍 *{district_name}* — *{date}*:\n"]
-                        for s in available:
-                            day_block.append(
-                                f"• `{s.get('name','UNKNOWN')}` — Normal: {s.get('capacity',0)} | VIP: {s.get('vipCapacity',0)}"
-                            )
-                        notification_results.append("\n".join(day_block))
-                        print(f"🆕 NEW/CHANGED: {district_name} on {date} - {len(available)} slots")
-                    else:
-                        print(f"✓ Unchanged: {district_name} on {date} - {len(available)} slots")
-                
-                # Save unavailable slots
-                if unavailable:
-                    save_unavailable_slots({district_name: {date: unavailable}})
-                
-            except requests.exceptions.Timeout:
-                print(f"⏱️ Timeout: {district_name} on {date}")
-                continue
-            except Exception as e:
-                print(f"⚠️ Error: {district_name} on {date}: {e}")
+            if not adaptive_poller.claim((district_name, date), base_interval, DUE_TOLERANCE, force, backoff):
+                skipped += 1
                 continue
+            work_queue.put_nowait((work_queue.qsize(), district_name, code, date))
+    adaptive_poller.prune((d, date) for d in all_locations for date in valid_dates)
+    if skipped:
+        ADAPTIVE_SKIPPED.inc(skipped)
+        print(f"💤 Skipping {skipped} stable (district, date) keys this cycle")
     
-    # ALWAYS save to database (this updates last_checked timestamp)
-    print(f"\n💾 Saving ALL slots to database (updates timestamps)...")
-    if current_run_slots:
-        save_last_slots(current_run_slots)
-    else:
-        print("   No available slots to save")
+    diff_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    persist_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    notify_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
     
-    # Send notifications ONLY for changed slots
-    if any_new_slots:
-        final_msg = "🎉 *New/Changed Passport Slots*\n\n" + "\n\n".join(notification_results)
-        send_slack(final_msg)
-        print(f"\n{final_msg}\n")
-    else:
-        print("ℹ️  No new or changed slots (database still updated with timestamps)")
+    diff_task = asyncio.create_task(_diff_stage(diff_queue, persist_queue, notify_queue, stats))
+    persist_task = asyncio.create_task(_persist_stage(persist_queue, stats))
+    notify_task = asyncio.create_task(_notify_stage(notify_queue, stats))
+    
+    await asyncio.gather(*[
+        _fetch_stage(work_queue, diff_queue, stats)
+        for _ in range(CHECK_CONCURRENCY)
+    ])
+    await diff_queue.put(None)
+    
+    await asyncio.gather(diff_task, notify_task)
+    print(f"📣 Detection and notification done in {time.perf_counter() - run_started:.2f}s")
+    await persist_task
+    
+    stats.record("cycle", time.perf_counter() - run_started)
+    last_pipeline_stats = stats
     
     print(f"{'='*60}")
+    print(f"⏱️  Stage timings:\n{stats.summary()}")
     print(f"✓ Check complete at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*60}\n")
 
+# At most one check runs at a time (scheduler ticks and manual triggers alike)
+_check_lock = Lock()
+
+def check_passport_job(force=False):
+    """
+    Blocking entry point used by the scheduler and the API
+    Returns False without checking when another check is still running
+    """
+    if not _check_lock.acquire(blocking=False):
+        print("⏭️  Slot check already running - skipping this one")
+        CHECK_SKIPPED.inc(reason="overlap")
+        return False
+    try:
+        asyncio.run(check_passport_job_async(force))
+        return True
+    finally:
+        _check_lock.release()
+
 def manual_check_job():
-    """Manual trigger"""
-    check_passport_job()
\ No newline at end of file
+    """Manual trigger - checks every district regardless of its schedule"""
+    return check_passport_job(force=True)
\ No newline at end of file
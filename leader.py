@@ -0,0 +1,250 @@
+import os
+import socket
+import time
+import uuid
+from queue import Queue
+from threading import Event, Lock, Thread
+
+try:
+    import fcntl
+except ImportError:  # Windows - lock a byte of the file with msvcrt instead
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# -------------------- Configuration --------------------
+# Only one process polls upstream, writes slots and sends alerts; every
+# other API process/replica just serves requests and waits to take over.
+# "file" - lock file, for several workers/processes on one machine (default)
+# "db"   - lease row in Supabase, for replicas on different machines
+# "none" - every process polls (single-process deployments)
+LEADER_ELECTION = os.environ.get("LEADER_ELECTION", "file").lower()
+LEADER_LOCK_FILE = os.environ.get("LEADER_LOCK_FILE", "poller.lock")
+# Lease length; the leader renews every third of it, a dead leader's lease
+# runs out after at most this long and a follower takes over
+LEADER_LEASE_SECONDS = float(os.environ.get("LEADER_LEASE_SECONDS", "30"))
+# How often followers try to become leader
+LEADER_RETRY_SECONDS = float(os.environ.get("LEADER_RETRY_SECONDS", "5"))
+LEASE_NAME = "passport_poller"
+
+# Lease for LEADER_ELECTION=db (create once in Supabase). PostgREST hands
+# each request a pooled connection, so a session advisory lock would not
+# outlive the request - a lease row with an expiry does the same job:
+#
+#   create table if not exists poller_lease (
+#       name text primary key, holder text not null, expires_at timestamptz not null
+#   );
+#
+#   create or replace function acquire_poller_lease(p_name text, p_holder text, p_ttl_seconds int)
+#   returns boolean language sql volatile as $$
+#       insert into poller_lease as l (name, holder, expires_at)
+#       values (p_name, p_holder, now() + make_interval(secs => p_ttl_seconds))
+#       on conflict (name) do update
+#           set holder = excluded.holder, expires_at = excluded.expires_at
+#           where l.holder = excluded.holder or l.expires_at < now()
+#       returning true
+#   $$;
+#
+#   create or replace function release_poller_lease(p_name text, p_holder text)
+#   returns void language sql volatile as $$
+#       delete from poller_lease where name = p_name and holder = p_holder
+#   $$;
+ACQUIRE_LEASE_RPC = "acquire_poller_lease"
+RELEASE_LEASE_RPC = "release_poller_lease"
+
+def lock_file(handle):
+    """Non-blocking exclusive lock on an open file; raises OSError when it is held elsewhere"""
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+
+def unlock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+def file_locks_supported():
+    return fcntl is not None or msvcrt is not None
+
+class FileLock:
+    """Exclusive lock on a local file - released by the OS when the process dies"""
+
+    def __init__(self, path=LEADER_LOCK_FILE):
+        self.path = path
+        self._handle = None
+
+    def acquire(self):
+        if self._handle is not None:
+            return True
+        handle = open(self.path, "a+")
+        try:
+            lock_file(handle)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(f"{os.getpid()}@{socket.gethostname()}\n")
+        handle.flush()
+        self._handle = handle
+        return True
+
+    def release(self):
+        if self._handle is not None:
+            unlock_file(self._handle)
+            self._handle.close()
+            self._handle = None
+
+class DatabaseLease:
+    """Lease row renewed through an RPC; lost when renewal stops for LEADER_LEASE_SECONDS"""
+
+    def __init__(self, holder, ttl_seconds=LEADER_LEASE_SECONDS):
+        self.holder = holder
+        self.ttl_seconds = ttl_seconds
+        # Until when we can be sure nobody else took over (local clock, with margin)
+        self._valid_until = 0.0
+
+    def acquire(self):
+        """
+        Take or renew the lease. A failed request keeps a held lease while it
+        is surely still valid, so one network blip doesn't hand over polling.
+        """
+        from storage import get_supabase
+        started = time.monotonic()
+        try:
+            response = get_supabase().rpc(ACQUIRE_LEASE_RPC, {
+                "p_name": LEASE_NAME, "p_holder": self.holder, "p_ttl_seconds": int(self.ttl_seconds)
+            }).execute()
+        except Exception as e:
+            print(f"⚠️ Poller lease request failed: {e}")
+            return time.monotonic() < self._valid_until
+        held = response.data is True or response.data == [True]
+        self._valid_until = started + self.ttl_seconds * 2 / 3 if held else 0.0
+        return held
+
+    def release(self):
+        from storage import get_supabase
+        self._valid_until = 0.0
+        try:
+            get_supabase().rpc(RELEASE_LEASE_RPC, {"p_name": LEASE_NAME, "p_holder": self.holder}).execute()
+        except Exception as e:
+            print(f"⚠️ Poller lease release failed: {e}")
+
+class LeaderElector:
+    """
+    Background thread that keeps trying to acquire the lock/lease and calls
+    on_elected() when it gets it, on_demoted() when it loses it
+    The leader re-checks every third of the lease, followers every
+    LEADER_RETRY_SECONDS, so a dead leader is replaced automatically.
+    The callbacks run in order on a second thread, so a slow on_elected()
+    (state load) never delays renewing the lease.
+    """
+
+    def __init__(self, lock, on_elected, on_demoted, retry_seconds=LEADER_RETRY_SECONDS,
+                 renew_seconds=LEADER_LEASE_SECONDS / 3):
+        self.lock = lock
+        self.holder = getattr(lock, "holder", None) or f"{socket.gethostname()}:{os.getpid()}"
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._retry_seconds = retry_seconds
+        self._renew_seconds = renew_seconds
+        self._stop = Event()
+        self._state_lock = Lock()
+        self._thread = None
+        self._callbacks = Queue()
+        self._callback_thread = None
+        self.is_leader = False
+        self.since = None
+
+    def start(self):
+        self._callback_thread = Thread(target=self._dispatch, name="leader-callbacks", daemon=True)
+        self._callback_thread.start()
+        self._thread = Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def _dispatch(self):
+        while True:
+            callback = self._callbacks.get()
+            if callback is None:
+                return
+            self._call(callback)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._step()
+            self._stop.wait(self._renew_seconds if self.is_leader else self._retry_seconds)
+
+    def _step(self):
+        held = self.lock.acquire()
+        with self._state_lock:
+            changed = held != self.is_leader
+            self.is_leader = held
+            if changed:
+                self.since = time.time()
+        if not changed:
+            return
+        if held:
+            print(f"👑 {self.holder} is now the poller leader")
+            self._callbacks.put(self._on_elected)
+        else:
+            print(f"⏸️  {self.holder} lost poller leadership, polling paused")
+            self._callbacks.put(self._on_demoted)
+
+    @staticmethod
+    def _call(callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"⚠️ Leader election callback failed: {e}")
+
+    def stop(self):
+        """Step down and release the lock/lease (shutdown)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._state_lock:
+            was_leader = self.is_leader
+            self.is_leader = False
+        if was_leader:
+            self._callbacks.put(self._on_demoted)
+        # Let a running on_elected() finish and on_demoted() run before releasing
+        self._callbacks.put(None)
+        if self._callback_thread is not None:
+            self._callback_thread.join(timeout=30)
+        self.lock.release()
+
+    def status(self):
+        with self._state_lock:
+            return {
+                "mode": LEADER_ELECTION,
+                "holder": self.holder,
+                "is_leader": self.is_leader,
+                "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.since)) if self.since else None,
+            }
+
+class _NoLock:
+    """LEADER_ELECTION=none - always the leader"""
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+def build_lock():
+    if LEADER_ELECTION == "none":
+        return _NoLock()
+    if LEADER_ELECTION == "db":
+        return DatabaseLease(f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    if LEADER_ELECTION == "file":
+        if not file_locks_supported():
+            print("⚠️ LEADER_ELECTION=file: no file locking on this platform, every process polls (use db for several processes)")
+            return _NoLock()
+        return FileLock()
+    raise ValueError(f"⚠️ Unknown LEADER_ELECTION {LEADER_ELECTION!r} (expected file, db or none)")
@@ -1,17 +1,67 @@
+# Load .env before the modules below read their configuration
+from clients import load_env, clients
+load_env()
+
 from fastapi import FastAPI
-from scheduler import start_scheduler
+from fastapi.responses import PlainTextResponse
+from scheduler import start_scheduler, pause_scheduler
 from jobs import manual_check_job
 from waiting_room_handler import start_waiting_room_worker, waiting_room_queue
+from http_client import close_session
+from utils import flush_slack, start_spool_replayer, stop_spool_replayer, spool_status
+from metrics import REGISTRY, QUEUE_DEPTH
+from circuit_breaker import breaker_states
+from slot_state import slot_state
+from leader import LeaderElector, build_lock
+import retention
 
 app = FastAPI(title="Passport Slot Checker API")
 
-@app.on_event("startup")
-def startup_event():
+# Only the elected process polls; the others serve the API and stand by
+poller_election = None
+
+def start_polling():
+    """Became the poller leader"""
+    # Replay writes spooled before the last shutdown or by the previous leader
+    start_spool_replayer()
+    # Restore the slot state from the local snapshot (only the delta is
+    # fetched); after a failover re-read it, the previous leader wrote since
+    if not slot_state.warm_start():
+        slot_state.reconcile()
     # Start the waiting room handler first
     start_waiting_room_worker()
     # Then start the scheduler
     start_scheduler()
 
+def stop_polling():
+    """Lost poller leadership - stop fetching, writing and alerting"""
+    pause_scheduler()
+    waiting_room_queue.pause()
+    stop_spool_replayer()
+
+def is_poller():
+    return poller_election is not None and poller_election.is_leader
+
+@app.on_event("startup")
+def startup_event():
+    global poller_election
+    poller_election = LeaderElector(build_lock(), on_elected=start_polling, on_demoted=stop_polling)
+    poller_election.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Checkpoint the slot state and hand over leadership (stop_polling drains
+    # the spool), close the spool without replaying - this process is no
+    # longer the poller - drain queued Slack messages, release connections
+    if is_poller():
+        slot_state.checkpoint()
+    if poller_election is not None:
+        poller_election.stop()
+    clients.close("spool")
+    flush_slack()
+    clients.close("slack")
+    close_session()
+
 @app.get("/")
 def root():
     return {
@@ -19,10 +69,32 @@ def root():
         "message": "Passport Slot Checker API is running"
     }
 
+@app.get("/health")
+def health():
+    """Circuit breaker state per dependency; degraded while any is not closed"""
+    circuits = breaker_states()
+    degraded = any(c["state"] != "closed" for c in circuits.values())
+    return {
+        "status": "degraded" if degraded else "ok",
+        "circuits": circuits,
+        "write_spool": spool_status(),
+        "retention": retention.last_retention_report.to_dict() if retention.last_retention_report else None,
+        "poller": poller_election.status() if poller_election else None
+    }
+
 @app.get("/check_slots")
 def manual_check():
     """Manually trigger a slot check"""
-    manual_check_job()
+    if not is_poller():
+        return {
+            "status": "skipped",
+            "message": "This process is not the poller leader"
+        }
+    if not manual_check_job():
+        return {
+            "status": "skipped",
+            "message": "A slot check is already running"
+        }
     return {
         "status": "success",
         "message": "Manual slot check completed"
@@ -30,8 +102,17 @@ def manual_check():
 
 @app.get("/waiting_room_queue")
 def check_queue():
-    """Check waiting room queue status"""
+    """Check waiting room queue status, per (district, date)"""
+    registry = waiting_room_queue.snapshot()
     return {
         "queue_size": waiting_room_queue.qsize(),
-        "message": f"{waiting_room_queue.qsize()} tasks currently in waiting room queue"
-    }
\ No newline at end of file
+        "message": f"{len(registry['pending'])} tasks currently in waiting room queue",
+        **registry
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def export_metrics():
+    """Prometheus-style metrics (text exposition format)"""
+    QUEUE_DEPTH.set(waiting_room_queue.qsize(), queue="waiting_room")
+    QUEUE_DEPTH.set(spool_status()["pending"], queue="write_spool")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
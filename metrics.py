@@ -0,0 +1,188 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# Minimal Prometheus text-format metrics (no extra dependency)
+# Exposed by main.py on /metrics
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_key(label_names, labels):
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_names, key, extra=None):
+    pairs = list(zip(label_names, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry["buckets"]):
+                    labels = _format_labels(self.label_names, key, ("le", bound))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.label_names, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {entry['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {entry['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {entry['count']}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, documentation, label_names=()):
+    return REGISTRY.register(Counter(name, documentation, label_names))
+
+def gauge(name, documentation, label_names=()):
+    return REGISTRY.register(Gauge(name, documentation, label_names))
+
+def histogram(name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, label_names, buckets))
+
+# -------------------- Checker metrics --------------------
+FETCH_SECONDS = histogram(
+    "passport_fetch_seconds", "Timeslot API request latency", ["district"]
+)
+FETCH_TOTAL = counter(
+    "passport_fetch_total", "Timeslot API requests by outcome", ["district", "outcome"]
+)
+STAGE_SECONDS = histogram(
+    "passport_pipeline_stage_seconds", "Time spent per check pipeline stage (parse, diff, persist, notify, cycle)", ["stage"]
+)
+SUPABASE_WRITE_SECONDS = histogram(
+    "passport_supabase_write_seconds", "Supabase write request latency", ["table"]
+)
+SUPABASE_ROWS_WRITTEN = counter(
+    "passport_supabase_rows_written_total", "Rows written to Supabase", ["table"]
+)
+SUPABASE_WRITE_ERRORS = counter(
+    "passport_supabase_write_errors_total", "Rows that could not be written to Supabase", ["table"]
+)
+SLACK_POST_SECONDS = histogram(
+    "passport_slack_post_seconds", "Slack webhook post latency"
+)
+SLACK_POSTS_TOTAL = counter(
+    "passport_slack_posts_total", "Slack webhook posts by outcome", ["outcome"]
+)
+QUEUE_DEPTH = gauge(
+    "passport_queue_depth", "Items waiting in internal queues", ["queue"]
+)
+CHECK_PERIOD_SECONDS = histogram(
+    "passport_check_period_seconds", "Actual time between the starts of consecutive scheduled checks",
+    buckets=(5, 10, 15, 30, 60, 120, 180, 240, 300, 600)
+)
+CHECK_SKIPPED = counter(
+    "passport_check_skipped_total", "Check runs skipped", ["reason"]
+)
+CHECK_OVERRUNS = counter(
+    "passport_check_overruns_total", "Checks that took longer than the target interval"
+)
+ADAPTIVE_SKIPPED = counter(
+    "passport_adaptive_skipped_total", "(district, date) checks skipped because the key was backed off"
+)
+CIRCUIT_STATE = gauge(
+    "passport_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["dependency"]
+)
+CIRCUIT_REJECTED = counter(
+    "passport_circuit_rejected_total", "Calls rejected by an open circuit breaker", ["dependency"]
+)
+RETENTION_ROWS_DELETED = counter(
+    "passport_retention_rows_deleted_total", "Expired rows removed by the retention job", ["table"]
+)
+RETENTION_SECONDS = histogram(
+    "passport_retention_seconds", "Duration of one retention run"
+)
@@ -0,0 +1,224 @@
+import os
+import random
+import time
+from datetime import datetime
+from threading import Condition, Thread
+from metrics import SLACK_POSTS_TOTAL, QUEUE_DEPTH
+
+# -------------------- Configuration --------------------
+# Messages arriving within this window are sent as one post
+COALESCE_SECONDS = float(os.environ.get("SLACK_COALESCE_SECONDS", "2"))
+# Slack allows roughly one webhook post per second
+MIN_INTERVAL_SECONDS = float(os.environ.get("SLACK_MIN_INTERVAL_SECONDS", "1"))
+# Identical notices (waiting room, errors) within this window are only sent
+# once; slot-change messages are never deduplicated - they are only produced
+# when the slot state changed, and gone -> back -> gone repeats them on purpose
+DEDUPE_SECONDS = float(os.environ.get("SLACK_DEDUPE_SECONDS", "300"))
+# Keep combined posts well under Slack's 40k character text limit
+MAX_MESSAGE_CHARS = int(os.environ.get("SLACK_MAX_MESSAGE_CHARS", "12000"))
+MAX_ATTEMPTS = int(os.environ.get("SLACK_MAX_ATTEMPTS", "5"))
+MAX_QUEUE = int(os.environ.get("SLACK_MAX_QUEUE", "500"))
+
+SEPARATOR = "\n\n"
+
+class SlackNotifier:
+    """
+    Outbound Slack queue with a background sender thread
+
+    enqueue() never blocks on the network. The sender waits COALESCE_SECONDS
+    after the first pending message, joins everything pending into as few
+    posts as fit MAX_MESSAGE_CHARS, keeps MIN_INTERVAL_SECONDS between posts
+    and backs off on 429 (Retry-After) and errors.
+
+    post(text) must return the HTTP response, or None when the request failed.
+    """
+
+    def __init__(self, post, breaker=None):
+        self._post = post
+        self._breaker = breaker
+        self._pending = []
+        self._recent = {}
+        self._cond = Condition()
+        self._thread = None
+        self._stopping = False
+        self._flush_requested = False
+        self._sending = False
+        self._last_post = 0.0
+
+    # ---------------- producer side ----------------
+    def enqueue(self, message, dedupe=True):
+        """
+        Queue a message; returns False when it was dropped as a duplicate
+        dedupe=False always sends it (slot changes)
+        """
+        now = time.monotonic()
+        with self._cond:
+            if dedupe:
+                self._recent = {text: ts for text, ts in self._recent.items() if now - ts < DEDUPE_SECONDS}
+                if message in self._recent:
+                    SLACK_POSTS_TOTAL.inc(outcome="deduplicated")
+                    return False
+                self._recent[message] = now
+            
+            if len(self._pending) >= MAX_QUEUE:
+                dropped = self._pending.pop(0)
+                SLACK_POSTS_TOTAL.inc(outcome="dropped")
+                print(f"⚠️ Slack queue full, dropped: {dropped[:60]}")
+            self._pending.append(message)
+            QUEUE_DEPTH.set(len(self._pending), queue="slack")
+            self._cond.notify()
+        
+        self._ensure_started()
+        return True
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = Thread(target=self._run, name="slack-notifier", daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout=30):
+        """Send everything pending now (shutdown, benchmarks); True when drained"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._pending or self._sending) and time.monotonic() < deadline:
+                self._flush_requested = bool(self._pending)
+                self._cond.notify_all()
+                self._cond.wait(timeout=0.1)
+            return not self._pending and not self._sending
+
+    def stop(self, timeout=30):
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    # ---------------- sender thread ----------------
+    def _take_batch(self):
+        """Wait for messages, let the coalesce window fill, then take them"""
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            if self._stopping and not self._pending:
+                return None
+            
+            # enqueue() wakes us to re-check; flush()/stop() end the window early
+            first_seen = time.monotonic()
+            while not (self._stopping or self._flush_requested):
+                if sum(len(m) + len(SEPARATOR) for m in self._pending) >= MAX_MESSAGE_CHARS:
+                    break
+                remaining = COALESCE_SECONDS - (time.monotonic() - first_seen)
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+            
+            batch, self._pending = self._pending, []
+            self._flush_requested = False
+            self._sending = True
+            QUEUE_DEPTH.set(0, queue="slack")
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                if len(batch) > 1:
+                    SLACK_POSTS_TOTAL.inc(len(batch) - 1, outcome="coalesced")
+                for text in self._combine(batch):
+                    self._deliver(text)
+            finally:
+                with self._cond:
+                    self._sending = False
+                    self._cond.notify_all()
+
+    def _combine(self, batch):
+        posts = []
+        current = ""
+        for message in batch:
+            if len(message) > MAX_MESSAGE_CHARS:
+                message = message[:MAX_MESSAGE_CHARS - 20] + "\n… (truncated)"
+            candidate = f"{current}{SEPARATOR}{message}" if current else message
+            if len(candidate) > MAX_MESSAGE_CHARS and current:
+                posts.append(current)
+                current = message
+            else:
+                current = candidate
+        if current:
+            posts.append(current)
+        return posts
+
+    def _deliver(self, text):
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        payload = f"[{ts}]\n{text}"
+        
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            wait = self._last_post + MIN_INTERVAL_SECONDS - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            
+            # Webhook circuit open - wait for the next probe instead of posting
+            if self._breaker is not None and not self._breaker.allow():
+                backoff = min(60.0, max(1.0, self._breaker.retry_in()))
+                print(f"⛔ Slack circuit open, retrying in {backoff:.0f}s")
+                if attempt < MAX_ATTEMPTS:
+                    time.sleep(backoff)
+                continue
+            
+            response = self._post(payload)
+            self._last_post = time.monotonic()
+            
+            if response is not None and response.status_code == 200:
+                return True
+            
+            if response is not None and response.status_code == 429:
+                try:
+                    backoff = float(response.headers.get("Retry-After", "1"))
+                except ValueError:
+                    backoff = 1.0
+                print(f"⏳ Slack rate limited, retrying in {backoff:.0f}s")
+            elif response is not None and 400 <= response.status_code < 500:
+                # Bad payload or revoked webhook - retrying won't help
+                print(f"⚠️ Slack rejected message with status {response.status_code}")
+                return False
+            else:
+                backoff = min(30.0, 2 ** (attempt - 1)) + random.uniform(0, 0.5)
+            
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(backoff)
+        
+        SLACK_POSTS_TOTAL.inc(outcome="gave_up")
+        print(f"❌ Slack message dropped after {MAX_ATTEMPTS} attempts")
+        return False
+
+# -------------------- Formatting --------------------
+def format_slot_changes(district_name, date, diff, current):
+    """
+    Slack block for one (district, date) listing only what changed:
+    new slots, capacity up/down, slots gone. Unchanged slots are collapsed
+    into a count.
+    """
+    lines = [f"📍 *{district_name}* — *{date}*:"]
+    for s in diff.added:
+        lines.append(f"• 🆕 `{s.name}` — Normal: {s.capacity} | VIP: {s.vip_capacity}")
+    for change in diff.changed:
+        old, new = change
+        went_up = (new.capacity + new.vip_capacity) > (old.capacity + old.vip_capacity)
+        lines.append(
+            f"• {'📈' if went_up else '📉'} `{new.name}` — "
+            f"Normal: {old.capacity} → {new.capacity} | VIP: {old.vip_capacity} → {new.vip_capacity}"
+        )
+    for s in diff.removed:
+        lines.append(f"• ❌ `{s.name}` — gone")
+    
+    unchanged = len(current) - len(diff.added) - len(diff.changed)
+    if unchanged > 0:
+        lines.append(f"• _{unchanged} unchanged slot{'s' if unchanged != 1 else ''}_")
+    return "\n".join(lines)
@@ -0,0 +1,116 @@
+import os
+import time
+from datetime import timedelta
+from storage import get_storage
+from schedule_config import get_schedule_profile
+from utils import (
+    retry_operation,
+    is_incremental_mode,
+    TABLE_NAME,
+    UNAVAILABLE_TABLE_NAME,
+    CURRENT_TABLE_NAME,
+    CHANGES_TABLE_NAME
+)
+from metrics import RETENTION_ROWS_DELETED, RETENTION_SECONDS
+
+# Expired rows are pruned by their own scheduled job, one date partition at a
+# time, in bounded batches - never from the check cycle
+RETENTION_INTERVAL_MINUTES = int(os.environ.get("RETENTION_INTERVAL_MINUTES", "60"))
+# Dates older than today minus this many days expire (1 keeps yesterday)
+RETENTION_KEEP_DAYS = int(os.environ.get("RETENTION_KEEP_DAYS", "1"))
+# Rows per delete request
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "1000"))
+# Upper bound on delete requests per run; the rest waits for the next run
+RETENTION_MAX_BATCHES = int(os.environ.get("RETENTION_MAX_BATCHES", "200"))
+# Breather between batches so retention never competes with the checker
+RETENTION_BATCH_PAUSE_SECONDS = float(os.environ.get("RETENTION_BATCH_PAUSE_SECONDS", "0.05"))
+
+class RetentionReport:
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.deleted = {}
+        self.batches = 0
+        self.complete = True
+        self.seconds = 0.0
+        self.errors = []
+
+    def record(self, table, date, count):
+        self.deleted.setdefault(table, {})
+        self.deleted[table][date] = self.deleted[table].get(date, 0) + count
+
+    @property
+    def total(self):
+        return sum(count for dates in self.deleted.values() for count in dates.values())
+
+    def to_dict(self):
+        return {
+            "cutoff": self.cutoff,
+            "rows_deleted": self.total,
+            "by_table": {table: sum(dates.values()) for table, dates in self.deleted.items()},
+            "by_date": self.deleted,
+            "batches": self.batches,
+            "seconds": round(self.seconds, 3),
+            "complete": self.complete,
+            "errors": self.errors,
+        }
+
+# Report of the most recent run (read by /health)
+last_retention_report = None
+
+def _retention_tables():
+    tables = [TABLE_NAME, UNAVAILABLE_TABLE_NAME]
+    if is_incremental_mode():
+        tables += [CURRENT_TABLE_NAME, CHANGES_TABLE_NAME]
+    return tables
+
+def _prune_table(storage, table, cutoff, report):
+    """Delete expired partitions of one table, oldest date first"""
+    while report.batches < RETENTION_MAX_BATCHES:
+        date = retry_operation(lambda: storage.oldest_date(table, cutoff), breaker=storage.breaker)
+        if date is None:
+            return
+        
+        # One partition in bounded batches until it is empty
+        while report.batches < RETENTION_MAX_BATCHES:
+            count = retry_operation(
+                lambda: storage.delete_batch(table, date, RETENTION_BATCH_SIZE), breaker=storage.breaker
+            )
+            report.batches += 1
+            if count:
+                report.record(table, date, count)
+                RETENTION_ROWS_DELETED.inc(count, table=table)
+            if count < RETENTION_BATCH_SIZE:
+                break
+            time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+    report.complete = False
+
+def run_retention():
+    """Remove slot rows of expired dates from every slot table; returns the report"""
+    global last_retention_report
+    
+    today = get_schedule_profile().local_now().date()
+    cutoff = (today - timedelta(days=RETENTION_KEEP_DAYS)).strftime("%Y-%m-%d")
+    storage = get_storage()
+    report = RetentionReport(cutoff)
+    started = time.perf_counter()
+    
+    for table in _retention_tables():
+        try:
+            _prune_table(storage, table, cutoff, report)
+        except Exception as e:
+            report.complete = False
+            report.errors.append(f"{table}: {str(e)[:200]}")
+            print(f"⚠️ Retention failed for {table}: {e}")
+    
+    report.seconds = time.perf_counter() - started
+    RETENTION_SECONDS.observe(report.seconds)
+    last_retention_report = report
+    
+    if report.total or not report.complete:
+        per_table = ", ".join(f"{table}: {count}" for table, count in report.to_dict()["by_table"].items())
+        print(
+            f"🧹 Retention removed {report.total} rows before {cutoff} in {report.seconds:.2f}s "
+            f"({report.batches} batches{'; ' + per_table if per_table else ''})"
+            f"{'' if report.complete else ' - more left for the next run'}"
+        )
+    return report
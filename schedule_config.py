@@ -0,0 +1,191 @@
+import json
+import os
+import time
+from datetime import datetime, date as dt_date, time as dt_time
+from threading import Lock
+from zoneinfo import ZoneInfo
+
+# Declarative polling schedule, see schedule_profiles.json:
+#
+#   timezone                  IANA name the windows and dates are evaluated in
+#   days_ahead                how many days get_valid_dates() looks ahead
+#   skip_weekdays             weekday names never checked (offices closed)
+#   holidays                  "YYYY-MM-DD" dates never checked
+#   default_interval_seconds  interval outside every window
+#   windows                   [{"name", "start": "HH:MM", "end": "HH:MM",
+#                               "interval_seconds", "days": [weekday names]}]
+#                             first match wins, end is inclusive, start > end
+#                             wraps past midnight, "days" is optional
+#   district_overrides        {"District": {"default_interval_seconds", "windows"}}
+#                             replaces the default/windows for that district
+#
+# The file is re-read when its mtime changes (checked every RELOAD_CHECK_SECONDS).
+
+SCHEDULE_PROFILE_FILE = os.environ.get("SCHEDULE_PROFILE_FILE", "schedule_profiles.json")
+RELOAD_CHECK_SECONDS = float(os.environ.get("SCHEDULE_RELOAD_CHECK_SECONDS", "5"))
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+DEFAULT_PROFILE = {
+    "timezone": "Asia/Kathmandu",
+    "days_ahead": 7,
+    "skip_weekdays": ["Saturday"],
+    "holidays": [],
+    "default_interval_seconds": 180,
+    "windows": [
+        {"name": "morning release", "start": "10:00", "end": "10:05", "interval_seconds": 5}
+    ],
+    "district_overrides": {}
+}
+
+def _parse_time(value):
+    hours, minutes = value.split(":")
+    return dt_time(int(hours), int(minutes))
+
+def _parse_weekdays(names):
+    days = set()
+    for name in names or []:
+        day = name.strip().lower()
+        if day not in WEEKDAYS:
+            raise ValueError(f"unknown weekday: {name}")
+        days.add(WEEKDAYS.index(day))
+    return days
+
+def _positive_interval(value, where):
+    interval = int(value)
+    if interval <= 0:
+        raise ValueError(f"{where}: interval must be positive")
+    return interval
+
+class ScheduleWindow:
+    __slots__ = ("name", "start", "end", "interval_seconds", "weekdays")
+
+    def __init__(self, spec):
+        self.name = spec.get("name", f"{spec['start']}-{spec['end']}")
+        self.start = _parse_time(spec["start"])
+        self.end = _parse_time(spec["end"])
+        self.interval_seconds = _positive_interval(spec["interval_seconds"], f"window {self.name}")
+        self.weekdays = _parse_weekdays(spec.get("days"))
+
+    def contains(self, local_now):
+        if self.weekdays and local_now.weekday() not in self.weekdays:
+            return False
+        now = local_now.time().replace(tzinfo=None)
+        if self.start <= self.end:
+            return self.start <= now <= self.end
+        return now >= self.start or now <= self.end
+
+class _Rules:
+    """Default interval + windows (global, or one district override)"""
+
+    def __init__(self, spec, fallback=None):
+        default = spec.get("default_interval_seconds")
+        if default is None and fallback is not None:
+            default = fallback.default_interval_seconds
+        self.default_interval_seconds = _positive_interval(default, "default_interval_seconds")
+        if "windows" in spec:
+            self.windows = [ScheduleWindow(w) for w in spec["windows"]]
+        else:
+            self.windows = list(fallback.windows) if fallback else []
+
+    def window_at(self, local_now):
+        for window in self.windows:
+            if window.contains(local_now):
+                return window
+        return None
+
+    def interval_at(self, local_now):
+        window = self.window_at(local_now)
+        return window.interval_seconds if window else self.default_interval_seconds
+
+class ScheduleProfile:
+    def __init__(self, spec):
+        self.timezone = ZoneInfo(spec.get("timezone", "Asia/Kathmandu"))
+        self.days_ahead = int(spec.get("days_ahead", 7))
+        self.skip_weekdays = _parse_weekdays(spec.get("skip_weekdays"))
+        self.holidays = {dt_date.fromisoformat(d) for d in spec.get("holidays", [])}
+        self.rules = _Rules(spec)
+        self.district_rules = {
+            district: _Rules(override, fallback=self.rules)
+            for district, override in (spec.get("district_overrides") or {}).items()
+        }
+
+    def local_now(self, now=None):
+        if now is None:
+            return datetime.now(self.timezone)
+        if now.tzinfo is None:
+            now = now.astimezone()
+        return now.astimezone(self.timezone)
+
+    def interval_for(self, district=None, now=None):
+        """Target seconds between checks of a district (or the default) right now"""
+        rules = self.district_rules.get(district, self.rules)
+        return rules.interval_at(self.local_now(now))
+
+    def window_for(self, district=None, now=None):
+        """Window a district is in right now, or None outside every window"""
+        rules = self.district_rules.get(district, self.rules)
+        return rules.window_at(self.local_now(now))
+
+    def min_interval(self, now=None):
+        """Fastest interval of any district right now - how often the scheduler must tick a check"""
+        local_now = self.local_now(now)
+        intervals = [self.rules.interval_at(local_now)]
+        intervals.extend(rules.interval_at(local_now) for rules in self.district_rules.values())
+        return min(intervals)
+
+    def is_checkable(self, day):
+        return day.weekday() not in self.skip_weekdays and day not in self.holidays
+
+class ScheduleProfileLoader:
+    """Loads the profile file and hot-reloads it when it changes"""
+
+    def __init__(self, path=SCHEDULE_PROFILE_FILE):
+        self.path = path
+        self._lock = Lock()
+        self._profile = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def _read(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self._profile is None:
+                print(f"⚠️ {self.path} not found - using the built-in schedule")
+                self._profile = ScheduleProfile(DEFAULT_PROFILE)
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r") as f:
+                profile = ScheduleProfile(json.load(f))
+        except Exception as e:
+            print(f"❌ Invalid schedule profile {self.path}, keeping the previous one: {e}")
+            if self._profile is None:
+                self._profile = ScheduleProfile(DEFAULT_PROFILE)
+            self._mtime = mtime
+            return
+        if self._profile is not None:
+            print(f"🔁 Reloaded schedule profile from {self.path}")
+        self._profile = profile
+        self._mtime = mtime
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._profile is None or now - self._checked_at >= RELOAD_CHECK_SECONDS:
+                self._checked_at = now
+                self._read()
+            return self._profile
+
+    def reload(self):
+        """Force a re-read on the next get()"""
+        with self._lock:
+            self._mtime = None
+            self._checked_at = 0.0
+
+schedule_profiles = ScheduleProfileLoader()
+
+def get_schedule_profile():
+    return schedule_profiles.get()
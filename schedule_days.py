@@ -1,11 +1,19 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
+from schedule_config import get_schedule_profile
 
-def get_valid_dates(days_ahead=7):
-    """Return list of dates skipping Saturdays"""
+def get_valid_dates(days_ahead=None):
+    """
+    Return list of dates to check, in the profile's timezone, skipping
+    the profile's closed weekdays (Saturday) and holidays
+    """
+    profile = get_schedule_profile()
+    if days_ahead is None:
+        days_ahead = profile.days_ahead
+    today = profile.local_now().date()
     valid_dates = []
     for i in range(days_ahead):
-        date = datetime.now() + timedelta(days=i)
-        if date.weekday() == 5:  # skip Saturday
+        date = today + timedelta(days=i)
+        if not profile.is_checkable(date):
             continue
         valid_dates.append(date.strftime("%Y-%m-%d"))
     return valid_dates
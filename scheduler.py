@@ -1,24 +1,132 @@
+import os
+import random
+import time
+from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, time as dt_time, timedelta
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
 from jobs import check_passport_job
+from retention import run_retention, RETENTION_INTERVAL_MINUTES
+from slot_state import checkpoint_slot_state, CHECKPOINT_SECONDS
+from schedule_config import get_schedule_profile
+from metrics import CHECK_PERIOD_SECONDS, CHECK_SKIPPED, CHECK_OVERRUNS
 
-scheduler = BackgroundScheduler()
+# One fixed-rate tick job decides on each tick whether a check is due.
+# max_instances=1 + coalesce means ticks never overlap and a backlog of
+# missed ticks (slow check, restart, suspended host) collapses into one run.
+TICK_SECONDS = int(os.environ.get("SCHEDULER_TICK_SECONDS", "5"))
+# Spread the first tick after a (re)start so restarted replicas don't fire together
+START_JITTER_SECONDS = float(os.environ.get("SCHEDULER_START_JITTER_SECONDS", "3"))
+# Optional persistent jobstore, e.g. sqlite:///scheduler.sqlite (needs SQLAlchemy)
+JOBSTORE_URL = os.environ.get("SCHEDULER_JOBSTORE_URL")
 
-def dynamic_scheduler():
-    now = datetime.now().time()
-    start_fast = dt_time(10, 0)
-    end_fast = dt_time(10, 5)
-    interval_seconds = 5 if start_fast <= now <= end_fast else 180
+JOB_ID = "passport_check_tick"
+RETENTION_JOB_ID = "slot_retention"
+CHECKPOINT_JOB_ID = "slot_state_checkpoint"
+# First retention run this long after startup, away from the first checks
+RETENTION_START_DELAY_SECONDS = 60
 
-    scheduler.add_job(
-        dynamic_scheduler,
-        'date',
-        run_date=datetime.now() + timedelta(seconds=interval_seconds)
-    )
+def _build_scheduler():
+    if not JOBSTORE_URL:
+        return BackgroundScheduler()
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    return BackgroundScheduler(jobstores={"default": SQLAlchemyJobStore(url=JOBSTORE_URL)})
+
+scheduler = _build_scheduler()
+
+_last_started = None
 
-    check_passport_job()
-    print(f"Next check in {interval_seconds} seconds.")
+def current_interval(now=None):
+    """
+    Target seconds between checks from schedule_profiles.json - the fastest
+    interval of any district right now (jobs.py skips districts not yet due)
+    """
+    return get_schedule_profile().min_interval(now)
+
+def run_check():
+    """Tick job: run a check when the current interval has elapsed"""
+    global _last_started
+    
+    interval = current_interval()
+    now = time.monotonic()
+    # Half a tick of slack so a 180 s interval isn't pushed to the next tick
+    if _last_started is not None and now - _last_started < interval - TICK_SECONDS / 2:
+        return
+    
+    period = None if _last_started is None else now - _last_started
+    started = time.perf_counter()
+    if not check_passport_job():
+        return
+    _last_started = now
+    elapsed = time.perf_counter() - started
+    
+    if period is not None:
+        CHECK_PERIOD_SECONDS.observe(period)
+    if elapsed > interval:
+        CHECK_OVERRUNS.inc()
+        print(f"⚠️ Check took {elapsed:.1f}s, longer than the {interval}s interval")
+    print(f"Next check in {interval} seconds (this one took {elapsed:.1f}s).")
+
+def _on_skipped_tick(event):
+    if event.code == EVENT_JOB_MAX_INSTANCES:
+        CHECK_SKIPPED.inc(reason="tick_overlap")
+    else:
+        CHECK_SKIPPED.inc(reason="missed_tick")
 
 def start_scheduler():
-    scheduler.start()
-    dynamic_scheduler()
+    # Already set up (leadership regained) - just let the jobs fire again
+    if scheduler.running:
+        scheduler.resume()
+        print("✓ Scheduler resumed")
+        return
+    
+    # Start paused so a persisted job can be inspected before it fires
+    scheduler.start(paused=True)
+    scheduler.add_listener(_on_skipped_tick, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    
+    first_run = datetime.now().astimezone() + timedelta(seconds=random.uniform(0, START_JITTER_SECONDS))
+    existing = scheduler.get_job(JOB_ID)
+    if existing is not None and existing.next_run_time and existing.next_run_time > first_run:
+        first_run = existing.next_run_time
+    
+    scheduler.add_job(
+        run_check,
+        "interval",
+        seconds=TICK_SECONDS,
+        id=JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=TICK_SECONDS,
+        next_run_time=first_run,
+    )
+    
+    # Expired-row cleanup runs on its own, never inside a check
+    scheduler.add_job(
+        run_retention,
+        "interval",
+        minutes=RETENTION_INTERVAL_MINUTES,
+        id=RETENTION_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now().astimezone() + timedelta(seconds=RETENTION_START_DELAY_SECONDS),
+    )
+    
+    # Local snapshot of the slot state for warm restarts
+    scheduler.add_job(
+        checkpoint_slot_state,
+        "interval",
+        seconds=CHECKPOINT_SECONDS,
+        id=CHECKPOINT_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.resume()
+    print(f"✓ Scheduler started (tick {TICK_SECONDS}s, first check at {first_run.strftime('%H:%M:%S')})")
+
+def pause_scheduler():
+    """Stop firing jobs (leadership lost); a running check finishes on its own"""
+    if scheduler.running:
+        scheduler.pause()
+        print("⏸️  Scheduler paused")
@@ -0,0 +1,123 @@
+import hashlib
+from typing import NamedTuple
+
+class Slot(NamedTuple):
+    """One time slot - immutable and tuple-backed"""
+    name: str
+    capacity: int
+    vip_capacity: int
+
+    @classmethod
+    def from_dict(cls, s):
+        return cls(s.get("name", "UNKNOWN"), s.get("capacity", 0), s.get("vipCapacity", 0))
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "vipCapacity": self.vip_capacity,
+            "status": True
+        }
+
+class SlotChange(NamedTuple):
+    """Same slot name, different capacity"""
+    old: Slot
+    new: Slot
+
+class SlotDiff(NamedTuple):
+    added: tuple = ()
+    removed: tuple = ()
+    changed: tuple = ()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def to_dict(self):
+        """JSON-friendly form for the change log"""
+        def _record(s):
+            return {"name": s.name, "capacity": s.capacity, "vipCapacity": s.vip_capacity}
+        
+        return {
+            "added": [_record(s) for s in self.added],
+            "removed": [_record(s) for s in self.removed],
+            "changed": [
+                {
+                    "name": c.new.name,
+                    "capacity": [c.old.capacity, c.new.capacity],
+                    "vipCapacity": [c.old.vip_capacity, c.new.vip_capacity]
+                }
+                for c in self.changed
+            ]
+        }
+
+NO_CHANGES = SlotDiff()
+
+def _fingerprint(slots):
+    """Stable across processes (unlike hash()), so it can be stored"""
+    digest = hashlib.blake2b(digest_size=8)
+    for s in slots:
+        digest.update(f"{s.name}\x1f{s.capacity}\x1f{s.vip_capacity}\x1e".encode())
+    return int.from_bytes(digest.digest(), "big")
+
+class SlotSnapshot:
+    """
+    Slots of one (district, date) at one point in time
+    Slots are kept sorted by name (one per name, last one wins, like the
+    old dict-based comparison) and fingerprinted once on construction, so
+    "did anything change" is a single integer comparison
+    """
+    __slots__ = ("slots", "fingerprint")
+
+    def __init__(self, slots=()):
+        by_name = {s.name: s for s in slots}
+        self.slots = tuple(by_name[name] for name in sorted(by_name))
+        self.fingerprint = _fingerprint(self.slots)
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        return cls(Slot.from_dict(s) for s in dicts)
+
+    @classmethod
+    def coerce(cls, value):
+        """Accept a snapshot, a list of slot dicts or None"""
+        if isinstance(value, cls):
+            return value
+        return cls.from_dicts(value or [])
+
+    def to_dicts(self):
+        return [s.to_dict() for s in self.slots]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __eq__(self, other):
+        return isinstance(other, SlotSnapshot) and self.fingerprint == other.fingerprint and self.slots == other.slots
+
+    def __hash__(self):
+        return self.fingerprint
+
+    def __repr__(self):
+        return f"SlotSnapshot({len(self.slots)} slots, fingerprint={self.fingerprint:016x})"
+
+EMPTY_SNAPSHOT = SlotSnapshot()
+
+def diff_snapshots(prev, current):
+    """Structured diff: added, removed and capacity-changed slots"""
+    prev = SlotSnapshot.coerce(prev)
+    current = SlotSnapshot.coerce(current)
+    if prev.fingerprint == current.fingerprint:
+        return NO_CHANGES
+    
+    prev_by_name = {s.name: s for s in prev.slots}
+    current_by_name = {s.name: s for s in current.slots}
+    added = tuple(s for name, s in current_by_name.items() if name not in prev_by_name)
+    removed = tuple(s for name, s in prev_by_name.items() if name not in current_by_name)
+    changed = tuple(
+        SlotChange(prev_by_name[name], s)
+        for name, s in current_by_name.items()
+        if name in prev_by_name and prev_by_name[name] != s
+    )
+    return SlotDiff(added, removed, changed)
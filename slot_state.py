@@ -0,0 +1,244 @@
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+from threading import RLock
+from utils import load_last_slots, NEPAL_TZ
+from schedule_days import get_valid_dates
+from slot_model import Slot, SlotSnapshot, EMPTY_SNAPSHOT
+
+# How often the in-memory state is re-read from Supabase (seconds)
+RECONCILE_SECONDS = int(os.environ.get("SLOT_STATE_RECONCILE_SECONDS", "900"))
+# Wait after a failed load before trying again (the store is likely down)
+RECONCILE_RETRY_SECONDS = int(os.environ.get("SLOT_STATE_RECONCILE_RETRY_SECONDS", "60"))
+
+# -------------------- Warm start --------------------
+# The state is checkpointed to a small gzipped JSON file; on startup it is
+# restored from there and only rows written since the checkpoint are fetched
+SNAPSHOT_FILE = os.environ.get("SLOT_STATE_SNAPSHOT_FILE", "slot_state.snapshot")
+CHECKPOINT_SECONDS = int(os.environ.get("SLOT_STATE_CHECKPOINT_SECONDS", "60"))
+# Older snapshots are ignored and the state is loaded in full
+SNAPSHOT_MAX_AGE_SECONDS = int(os.environ.get("SLOT_STATE_SNAPSHOT_MAX_AGE_SECONDS", "21600"))
+# The delta load starts this long before the checkpoint (clock skew, writes in flight)
+SNAPSHOT_OVERLAP_SECONDS = 60
+SNAPSHOT_VERSION = 1
+
+def _read_snapshot(path):
+    """Parsed snapshot file, or None when missing, unreadable or from another version"""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            payload = json.load(handle)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable slot state snapshot {path}: {e}")
+        return None
+    if payload.get("version") != SNAPSHOT_VERSION:
+        return None
+    return payload
+
+class SlotStateStore:
+    """
+    Shared in-memory copy of the last known available slots
+    {district: {date: SlotSnapshot}}
+
+    Loaded once from Supabase, then kept current write-through by the
+    checker job and the waiting room worker. A periodic reconcile re-reads
+    the table so the store can't drift from the database for long.
+    """
+
+    def __init__(self, loader=load_last_slots, reconcile_seconds=RECONCILE_SECONDS):
+        self._loader = loader
+        self._reconcile_seconds = reconcile_seconds
+        self._lock = RLock()
+        self._state = {}
+        self._loaded_at = None
+        # No load attempt before this (monotonic) time after a failure
+        self._retry_at = 0.0
+        # Keys written while a reconcile is loading - they win over the DB copy
+        self._written_during_load = set()
+        self._loading = False
+        # Bumped on every change so checkpoints skip an unchanged state
+        self._version = 0
+        self._checkpointed_version = 0
+
+    def ensure_loaded(self):
+        """
+        Load on first use and reconcile when the interval has passed
+        (blocking - the checker calls it from a worker thread)
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = (
+                self._loaded_at is None
+                or now - self._loaded_at >= self._reconcile_seconds
+            ) and now >= self._retry_at
+        if due:
+            self.reconcile()
+
+    def reconcile(self):
+        """Replace the in-memory state with a fresh read from Supabase"""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+            self._written_during_load = set()
+
+        try:
+            loaded = self._loader(raise_on_error=True)
+        except Exception as e:
+            print(f"⚠️ Slot state reconcile failed, keeping in-memory state: {e}")
+            with self._lock:
+                self._loading = False
+                # Don't hammer the store - every failure backs off
+                self._retry_at = time.monotonic() + RECONCILE_RETRY_SECONDS
+            return
+
+        fresh = {
+            district: {date: SlotSnapshot.from_dicts(slots) for date, slots in dates.items()}
+            for district, dates in loaded.items()
+        }
+        
+        with self._lock:
+            for district, date in self._written_during_load:
+                slots = self._state.get(district, {}).get(date)
+                if slots:
+                    fresh.setdefault(district, {})[date] = slots
+                else:
+                    fresh.get(district, {}).pop(date, None)
+            self._state = fresh
+            self._loaded_at = time.monotonic()
+            self._retry_at = 0.0
+            self._loading = False
+            self._written_during_load = set()
+            self._version += 1
+
+        total = sum(len(dates) for dates in fresh.values())
+        print(f"🔄 Slot state reconciled: {total} (district, date) keys")
+
+    def get_snapshot(self, district, date):
+        """Last known SlotSnapshot for one (district, date) - never loads, see ensure_loaded()"""
+        with self._lock:
+            return self._state.get(district, {}).get(date, EMPTY_SNAPSHOT)
+
+    def get(self, district, date):
+        """Last known available slots for one (district, date) as dicts"""
+        return self.get_snapshot(district, date).to_dicts()
+
+    def set(self, district, date, slots):
+        """Write-through update after slots were persisted (dicts or a SlotSnapshot)"""
+        snapshot = SlotSnapshot.coerce(slots)
+        with self._lock:
+            if snapshot:
+                self._state.setdefault(district, {})[date] = snapshot
+            else:
+                self._state.get(district, {}).pop(date, None)
+            self._version += 1
+            if self._loading:
+                self._written_during_load.add((district, date))
+
+    def remove(self, district, date):
+        self.set(district, date, [])
+
+    def update(self, slots_dict):
+        """Apply a {district: {date: [slot, ...]}} dict"""
+        for district, dates in slots_dict.items():
+            for date, slots in dates.items():
+                self.set(district, date, slots)
+
+    def snapshot(self):
+        """Copy of the whole state as slot dicts"""
+        self.ensure_loaded()
+        with self._lock:
+            return {
+                district: {date: snapshot.to_dicts() for date, snapshot in dates.items()}
+                for district, dates in self._state.items()
+            }
+
+    def checkpoint(self, path=SNAPSHOT_FILE):
+        """Write the state to the local snapshot file if it changed since the last checkpoint"""
+        with self._lock:
+            if self._loaded_at is None or self._version == self._checkpointed_version:
+                return False
+            version = self._version
+            state = {
+                district: {date: [list(slot) for slot in snapshot] for date, snapshot in dates.items()}
+                for district, dates in self._state.items()
+            }
+        
+        payload = {"version": SNAPSHOT_VERSION, "saved_at": datetime.now(NEPAL_TZ).isoformat(), "state": state}
+        tmp = path + ".tmp"
+        try:
+            with gzip.open(tmp, "wt", encoding="utf-8") as handle:
+                json.dump(payload, handle, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ Slot state checkpoint failed: {e}")
+            return False
+        
+        with self._lock:
+            self._checkpointed_version = version
+        return True
+
+    def warm_start(self, path=SNAPSHOT_FILE):
+        """
+        Restore the state from the local snapshot, then fetch only rows written
+        since it was taken. Without a usable snapshot nothing happens and the
+        first ensure_loaded() does the full load as before.
+        Returns True when the state came from the snapshot
+        """
+        payload = _read_snapshot(path)
+        if payload is None:
+            return False
+        
+        saved_at = datetime.fromisoformat(payload["saved_at"])
+        age = (datetime.now(NEPAL_TZ) - saved_at).total_seconds()
+        if age > SNAPSHOT_MAX_AGE_SECONDS:
+            print(f"ℹ️  Slot state snapshot is {age / 3600:.1f}h old, doing a full load instead")
+            return False
+        
+        started = time.perf_counter()
+        valid_dates = get_valid_dates()
+        restored = {}
+        for district, dates in payload["state"].items():
+            for date, slots in dates.items():
+                if date in valid_dates:
+                    restored.setdefault(district, {})[date] = SlotSnapshot(Slot(*slot) for slot in slots)
+        
+        # Keys written after the checkpoint (by us before a crash, or by another poller)
+        since = (saved_at - timedelta(seconds=SNAPSHOT_OVERLAP_SECONDS)).isoformat()
+        try:
+            delta = self._loader(raise_on_error=True, valid_dates=valid_dates, since=since)
+            loaded_at = time.monotonic()
+        except Exception as e:
+            print(f"⚠️ Delta load after warm start failed, using the snapshot alone: {e}")
+            delta = {}
+            # Full reconcile once the retry wait has passed
+            loaded_at = time.monotonic() - self._reconcile_seconds + RECONCILE_RETRY_SECONDS
+        
+        for district, dates in delta.items():
+            for date, slots in dates.items():
+                restored.setdefault(district, {})[date] = SlotSnapshot.from_dicts(slots)
+        
+        with self._lock:
+            if self._loaded_at is not None:
+                return False
+            self._state = restored
+            self._loaded_at = loaded_at
+            self._version += 1
+        
+        total = sum(len(dates) for dates in restored.values())
+        changed = sum(len(dates) for dates in delta.values())
+        print(
+            f"⚡ Slot state restored from snapshot ({age:.0f}s old): {total} (district, date) keys, "
+            f"{changed} updated since, in {time.perf_counter() - started:.2f}s"
+        )
+        return True
+
+# Shared by jobs.py and waiting_room_handler.py
+slot_state = SlotStateStore()
+
+def checkpoint_slot_state():
+    """Scheduler job - module-level so persistent jobstores can reference it"""
+    slot_state.checkpoint()
@@ -0,0 +1,348 @@
+import os
+import json
+import time
+from threading import Condition, Thread
+from circuit_breaker import is_data_rejection, backoff_delay
+from leader import lock_file, unlock_file, file_locks_supported
+
+# -------------------- Configuration --------------------
+# fsync every append batch (off trades durability on power loss for speed)
+FSYNC = os.environ.get("SLOT_SPOOL_FSYNC", "true").lower() in ("1", "true", "yes")
+# How often the replayer looks for new records when nobody wakes it
+REPLAY_INTERVAL_SECONDS = float(os.environ.get("SLOT_SPOOL_REPLAY_SECONDS", "2"))
+# Rows merged into one bulk write during replay
+REPLAY_BATCH_ROWS = int(os.environ.get("SLOT_SPOOL_REPLAY_BATCH_ROWS", "500"))
+MAX_RETRY_SECONDS = 60.0
+
+# segment-<number>-<pid>.open while its writer appends to it (and holds a
+# lock on it); renamed to .log once closed - only .log segments are replayed
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+OPEN_SUFFIX = ".open"
+REJECTED_FILE = "rejected.log"
+REPLAY_LOCK_FILE = "replay.lock"
+
+def _merge_inserts(records, max_rows):
+    """
+    Merge consecutive insert records for the same table into bulk writes of
+    up to max_rows rows. Upserts keep only the newest row per conflict key
+    (Postgres refuses to touch the same row twice in one statement).
+    Returns [(merged_record, number_of_source_records)]
+    """
+    merged = []
+    for record in records:
+        if merged and record["op"] == "insert":
+            last, count = merged[-1]
+            if (last["op"] == "insert" and last["table"] == record["table"]
+                    and last.get("on_conflict") == record.get("on_conflict")
+                    and len(last["rows"]) + len(record["rows"]) <= max_rows):
+                rows = last["rows"] + record["rows"]
+                if record.get("on_conflict"):
+                    keys = [c.strip() for c in record["on_conflict"].split(",")]
+                    rows = list({tuple(row[k] for k in keys): row for row in rows}.values())
+                merged[-1] = ({**last, "rows": rows}, count + 1)
+                continue
+        merged.append((record, 1))
+    return merged
+
+class WriteSpool:
+    """
+    Local append-only log of storage writes, drained by a background replayer
+
+    append() writes records as JSON lines to the active segment and fsyncs
+    once per call, so a persist batch costs one local fsync instead of remote
+    round trips. The replayer rotates the active segment, applies its records
+    in order through apply(record), merging consecutive inserts into bulk
+    writes, and deletes the segment once everything is applied. Failures
+    leave the remaining records for the next attempt (with backoff); only
+    records the store rejects as bad data go to rejected.log and on_rejected().
+    Delivery is at-least-once: a crash mid-replay re-applies that segment.
+    Only the process holding the directory's replay.lock runs the replayer,
+    and it only takes closed (.log) segments - a segment another process is
+    still writing is left alone until that process closes it or dies.
+    """
+
+    def __init__(self, directory, apply, on_rejected=None, batch_rows=REPLAY_BATCH_ROWS):
+        self.directory = directory
+        self._apply = apply
+        self._on_rejected = on_rejected
+        self._batch_rows = batch_rows
+        self._cond = Condition()
+        self._active = None
+        self._active_path = None
+        self._counted = set()
+        self._pending = 0
+        self._replaying = False
+        self._retry_at = 0.0
+        self._failures = 0
+        self._stopping = False
+        self._thread = None
+        self._lock_handle = None
+        self.last_error = None
+        os.makedirs(directory, exist_ok=True)
+        self._next_segment = 1
+        self._discover()
+        if self._pending:
+            print(f"📼 Write spool has {self._pending} records from a previous run")
+
+    # ---------------- segments ----------------
+    @staticmethod
+    def _segment_number(name):
+        return int(name[len(SEGMENT_PREFIX):].split(".")[0].split("-")[0])
+
+    @staticmethod
+    def _segment_id(path):
+        """Segment name without its .open / .log suffix"""
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def _list(self, suffix):
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(suffix)
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _segments(self):
+        """Closed segments, oldest first"""
+        return self._list(SEGMENT_SUFFIX)
+
+    def _discover(self):
+        """
+        Count records of closed segments not counted yet (left by a previous
+        process or closed by another one) and move the segment numbering past
+        every segment in the directory (lock held)
+        """
+        for path in self._list(OPEN_SUFFIX) + self._segments():
+            self._next_segment = max(self._next_segment, self._segment_number(os.path.basename(path)) + 1)
+        for path in self._segments():
+            segment_id = self._segment_id(path)
+            if segment_id not in self._counted:
+                self._counted.add(segment_id)
+                self._pending += len(self._read(path))
+
+    def _adopt_orphans(self):
+        """Close .open segments whose writer died (its lock is gone) so they get replayed"""
+        for path in self._list(OPEN_SUFFIX):
+            if path == self._active_path:
+                continue
+            try:
+                # Empty: possibly a writer between creating and locking it
+                if os.path.getsize(path) == 0:
+                    continue
+                handle = open(path, "a", encoding="utf-8") if file_locks_supported() else None
+            except OSError:
+                continue
+            if handle is not None:
+                try:
+                    lock_file(handle)
+                except OSError:
+                    handle.close()
+                    continue
+                unlock_file(handle)
+                handle.close()
+            os.replace(path, path[:-len(OPEN_SUFFIX)] + SEGMENT_SUFFIX)
+
+    @staticmethod
+    def _read(path):
+        records = []
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn last line after a crash - never acknowledged, skip it
+                    continue
+        return records
+
+    @staticmethod
+    def _rewrite(path, records):
+        """Atomically replace a segment with the records still to replay"""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as handle:
+            for record in records:
+                handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, path)
+
+    def _rotate(self):
+        """Close the active segment and mark it closed for the replayer (lock held)"""
+        if self._active is not None:
+            if file_locks_supported():
+                unlock_file(self._active)
+            self._active.close()
+            os.replace(self._active_path, self._active_path[:-len(OPEN_SUFFIX)] + SEGMENT_SUFFIX)
+            self._active = None
+            self._active_path = None
+
+    # ---------------- producer side ----------------
+    def append(self, records):
+        """Durably queue write records (one fsync for the whole list)"""
+        if not records:
+            return
+        lines = "".join(json.dumps(r, separators=(",", ":"), default=str) + "\n" for r in records)
+        with self._cond:
+            if self._active is None:
+                path = os.path.join(
+                    self.directory, f"{SEGMENT_PREFIX}{self._next_segment:010d}-{os.getpid()}{OPEN_SUFFIX}"
+                )
+                self._next_segment += 1
+                self._active = open(path, "a", encoding="utf-8")
+                if file_locks_supported():
+                    lock_file(self._active)
+                self._active_path = path
+                self._counted.add(self._segment_id(path))
+            self._active.write(lines)
+            self._active.flush()
+            if FSYNC:
+                os.fsync(self._active.fileno())
+            self._pending += len(records)
+            self._cond.notify_all()
+        self.start()
+
+    def pending(self):
+        with self._cond:
+            return self._pending
+
+    def pending_records(self):
+        """Records not replayed yet, oldest first (lets a load see its own writes)"""
+        with self._cond:
+            paths = self._segments()
+            if self._active_path is not None:
+                paths.append(self._active_path)
+        records = []
+        for path in sorted(paths, key=lambda p: self._segment_number(os.path.basename(p))):
+            try:
+                records.extend(self._read(path))
+            except FileNotFoundError:
+                # Replayed and removed meanwhile - already in the store
+                continue
+        return records
+
+    # ---------------- replayer ----------------
+    def _acquire_replay_lock(self):
+        if self._lock_handle is not None or not file_locks_supported():
+            return True
+        handle = open(os.path.join(self.directory, REPLAY_LOCK_FILE), "a+")
+        try:
+            lock_file(handle)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_handle = handle
+        return True
+
+    def _release_replay_lock(self):
+        if self._lock_handle is not None:
+            unlock_file(self._lock_handle)
+            self._lock_handle.close()
+            self._lock_handle = None
+
+    def start(self):
+        """Start the replayer; False when another process replays this directory"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return True
+            if not self._acquire_replay_lock():
+                return False
+            # Pick up segments another process closed since we last looked
+            self._discover()
+            self._stopping = False
+            self._thread = Thread(target=self._run, name="write-spool", daemon=True)
+            self._thread.start()
+            return True
+
+    def flush(self, timeout=30):
+        """Replay everything now (shutdown); True when the spool is empty"""
+        if not self.start():
+            return not self.pending()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._retry_at = 0.0
+            self._cond.notify_all()
+            while (self._pending or self._replaying) and time.monotonic() < deadline:
+                self._cond.wait(timeout=0.1)
+            return not self._pending
+
+    def stop(self, timeout=30):
+        """Drain, stop the replayer and hand the directory to the next process"""
+        drained = self.flush(timeout)
+        self.close()
+        return drained
+
+    def close(self):
+        """Stop the replayer without draining, close the active segment and release replay.lock"""
+        with self._cond:
+            self._stopping = True
+            self._rotate()
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+        if thread is None or not thread.is_alive():
+            self._release_replay_lock()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not (self._pending and time.monotonic() >= self._retry_at):
+                    self._cond.wait(timeout=REPLAY_INTERVAL_SECONDS)
+                    self._adopt_orphans()
+                    self._discover()
+                if self._stopping:
+                    return
+                self._rotate()
+                self._replaying = True
+                self._adopt_orphans()
+                self._discover()
+                segments = self._segments()
+
+            try:
+                ok = all(self._replay_segment(path) for path in segments)
+            except Exception as e:
+                print(f"⚠️ Write spool replay error: {e}")
+                ok = False
+
+            with self._cond:
+                self._replaying = False
+                if ok:
+                    self._failures = 0
+                    self._retry_at = 0.0
+                else:
+                    self._failures += 1
+                    self._retry_at = time.monotonic() + backoff_delay(self._failures, 1.0, MAX_RETRY_SECONDS)
+                self._cond.notify_all()
+
+    def _replay_segment(self, path):
+        """Apply one closed segment; False when it has to be retried later"""
+        records = self._read(path)
+        done = 0
+        for record, count in _merge_inserts(records, self._batch_rows):
+            try:
+                self._apply(record)
+            except Exception as e:
+                self.last_error = str(e)[:200]
+                if not is_data_rejection(e):
+                    print(f"⏸️  Write spool paused ({len(records) - done} records left in {os.path.basename(path)}): {e}")
+                    self._rewrite(path, records[done:])
+                    return False
+                self._reject(record, e)
+            done += count
+            self._settle(count)
+        os.remove(path)
+        with self._cond:
+            self._counted.discard(self._segment_id(path))
+        return True
+
+    def _settle(self, count):
+        with self._cond:
+            self._pending = max(0, self._pending - count)
+            self._cond.notify_all()
+
+    def _reject(self, record, error):
+        """Keep a write the store refuses in rejected.log instead of retrying forever"""
+        with open(os.path.join(self.directory, REJECTED_FILE), "a", encoding="utf-8") as handle:
+            handle.write(json.dumps({"error": str(error)[:500], "record": record}, default=str) + "\n")
+        print(f"❌ Write spool: {record.get('table')} rejected a write: {error}")
+        if self._on_rejected is not None:
+            self._on_rejected(record, error)
@@ -0,0 +1,362 @@
+import os
+import json
+import sqlite3
+from threading import Lock
+from clients import clients, require_env
+from circuit_breaker import supabase_breaker
+
+# -------------------- Backend selection --------------------
+# "supabase" - remote PostgREST tables (default)
+# "sqlite"   - local database file in WAL mode, for a checker running on
+#              the same box or benchmarks without network cost
+# "memory"   - process-local tables, nothing persisted
+STORAGE_BACKEND = os.environ.get("SLOT_STORAGE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.environ.get("SLOT_SQLITE_PATH", "slots.db")
+
+LOAD_COLUMNS = "district,date,name,normal_capacity,vip_capacity,last_checked"
+LATEST_SLOTS_RPC = "latest_slot_snapshots"
+# Rows per request when paging through a select (PostgREST caps a response
+# at its max-rows setting, 1000 by default on Supabase)
+PAGE_SIZE = int(os.environ.get("SUPABASE_PAGE_SIZE", "1000"))
+
+def newest_snapshot_rows(rows):
+    """
+    Keep only the rows of the newest run per (district, date)
+    (rows of one run share last_checked), one row per name
+    """
+    newest = {}
+    for row in rows:
+        key = (row["district"], str(row["date"]))
+        checked = row.get("last_checked") or ""
+        if checked > newest.get(key, ""):
+            newest[key] = checked
+
+    seen = set()
+    result = []
+    for row in rows:
+        key = (row["district"], str(row["date"]))
+        if (row.get("last_checked") or "") != newest.get(key, ""):
+            continue
+        if (key, row["name"]) in seen:
+            continue
+        seen.add((key, row["name"]))
+        result.append(row)
+    return result
+
+# -------------------- Supabase --------------------
+def _build_supabase():
+    from supabase import create_client
+    return create_client(require_env("SUPABASE_URL"), require_env("SUPABASE_KEY"))
+
+clients.register("supabase", _build_supabase)
+
+def get_supabase():
+    return clients.get("supabase")
+
+class SupabaseStorage:
+    """Slot tables in Supabase; calls go through the supabase circuit breaker"""
+    name = "supabase"
+    breaker = supabase_breaker
+
+    def __init__(self):
+        self._rpc_available = True
+
+    def select(self, table, dates, since=None):
+        """Rows of the given dates, only those checked at or after since when given"""
+        query = get_supabase().table(table).select(LOAD_COLUMNS).in_("date", dates)
+        if since:
+            query = query.gte("last_checked", since)
+        return query.execute().data
+
+    def load_latest(self, table, dates, since):
+        """Newest snapshot rows per (district, date) - RPC when installed, else a filtered select"""
+        if self._rpc_available:
+            try:
+                return get_supabase().rpc(LATEST_SLOTS_RPC, {"p_dates": dates}).execute().data
+            except Exception as e:
+                # PGRST202: function not found in the schema cache (404 without a JSON body)
+                if str(getattr(e, "code", None)) in ("PGRST202", "404"):
+                    print(f"ℹ️  RPC {LATEST_SLOTS_RPC} not available, using filtered select")
+                    self._rpc_available = False
+                else:
+                    raise
+
+        # Newest first with a stable order (id breaks last_checked ties), paged
+        # so no response is cut off at the server's row limit
+        rows = []
+        start = 0
+        while True:
+            page = (
+                get_supabase().table(table)
+                .select(LOAD_COLUMNS)
+                .in_("date", dates)
+                .gte("last_checked", since)
+                .order("last_checked", desc=True)
+                .order("id")
+                .range(start, start + PAGE_SIZE - 1)
+                .execute()
+            ).data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        return newest_snapshot_rows(rows)
+
+    def insert(self, table, rows, on_conflict=None):
+        """Bulk insert (upsert with on_conflict); returns the number of rows written"""
+        if on_conflict:
+            response = get_supabase().table(table).upsert(rows, on_conflict=on_conflict).execute()
+        else:
+            response = get_supabase().table(table).insert(rows).execute()
+        return len(response.data) if response.data else 0
+
+    def prune(self, table, district, date, keep_names):
+        query = get_supabase().table(table).delete().eq("district", district).eq("date", date)
+        if keep_names:
+            query = query.not_.in_("name", keep_names)
+        query.execute()
+
+    def delete_before(self, table, date):
+        response = get_supabase().table(table).delete().lt("date", date).execute()
+        return len(response.data) if response.data else 0
+
+    def oldest_date(self, table, before):
+        """Oldest date partition older than before, or None"""
+        response = get_supabase().table(table).select("date").lt("date", before).order("date").limit(1).execute()
+        return str(response.data[0]["date"]) if response.data else None
+
+    def delete_batch(self, table, date, limit):
+        """Delete up to limit rows of one date; returns how many went"""
+        response = get_supabase().table(table).select("id").eq("date", date).limit(limit).execute()
+        ids = [row["id"] for row in response.data or []]
+        if not ids:
+            return 0
+        get_supabase().table(table).delete().in_("id", ids).execute()
+        return len(ids)
+
+    def delete_all(self, table):
+        response = get_supabase().table(table).delete().neq("id", 0).execute()
+        return len(response.data) if response.data else 0
+
+# -------------------- SQLite --------------------
+_SQLITE_SCHEMA = """
+create table if not exists slots_available (
+    id integer primary key autoincrement,
+    district text not null, date text not null, name text not null,
+    normal_capacity integer, vip_capacity integer, last_checked text
+);
+create index if not exists slots_available_key_idx on slots_available (district, date, name);
+create index if not exists slots_available_latest_idx on slots_available (district, date, last_checked);
+create index if not exists slots_available_date_idx on slots_available (date);
+
+create table if not exists slots_unavailable (
+    id integer primary key autoincrement,
+    district text not null, date text not null, name text not null,
+    normal_capacity integer, vip_capacity integer, last_checked text
+);
+create index if not exists slots_unavailable_key_idx on slots_unavailable (district, date, name);
+create index if not exists slots_unavailable_date_idx on slots_unavailable (date);
+
+create table if not exists slots_current (
+    id integer primary key autoincrement,
+    district text not null, date text not null, name text not null,
+    normal_capacity integer, vip_capacity integer, last_checked text,
+    unique (district, date, name)
+);
+create index if not exists slots_current_date_idx on slots_current (date);
+
+create table if not exists slot_changes (
+    id integer primary key autoincrement,
+    district text not null, date text not null,
+    slots text not null, diff text, changed_at text not null
+);
+create index if not exists slot_changes_key_idx on slot_changes (district, date);
+create index if not exists slot_changes_date_idx on slot_changes (date);
+"""
+
+class SQLiteStorage:
+    """Slot tables in a local SQLite file (WAL), same layout as the Supabase ones"""
+    name = "sqlite"
+    breaker = None
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.executescript(_SQLITE_SCHEMA)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def select(self, table, dates, since=None):
+        marks = ",".join("?" * len(dates))
+        sql = f"select {LOAD_COLUMNS} from {table} where date in ({marks})"
+        if since:
+            return self._query(sql + " and last_checked >= ?", [*dates, since])
+        return self._query(sql, list(dates))
+
+    def load_latest(self, table, dates, since):
+        marks = ",".join("?" * len(dates))
+        rows = self._query(
+            f"""
+            select s.district, s.date, s.name, s.normal_capacity, s.vip_capacity, s.last_checked
+            from {table} s join (
+                select district, date, max(last_checked) as last_checked from {table}
+                where date in ({marks}) and last_checked >= ?
+                group by district, date
+            ) latest using (district, date, last_checked)
+            """,
+            [*dates, since],
+        )
+        return newest_snapshot_rows(rows)
+
+    def insert(self, table, rows, on_conflict=None):
+        if not rows:
+            return 0
+        columns = list(rows[0])
+        sql = f"insert into {table} ({','.join(columns)}) values ({','.join('?' * len(columns))})"
+        if on_conflict:
+            keys = [c.strip() for c in on_conflict.split(",")]
+            updates = ",".join(f"{c}=excluded.{c}" for c in columns if c not in keys)
+            sql += f" on conflict ({on_conflict}) do update set {updates}"
+        values = [
+            [json.dumps(row[c]) if isinstance(row[c], (dict, list)) else row[c] for c in columns]
+            for row in rows
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("begin")
+                self._conn.executemany(sql, values)
+        return len(rows)
+
+    def prune(self, table, district, date, keep_names):
+        marks = ",".join("?" * len(keep_names))
+        sql = f"delete from {table} where district = ? and date = ?"
+        if keep_names:
+            sql += f" and name not in ({marks})"
+        self._execute(sql, [district, date, *keep_names])
+
+    def delete_before(self, table, date):
+        return self._execute(f"delete from {table} where date < ?", [date])
+
+    def oldest_date(self, table, before):
+        rows = self._query(f"select min(date) as date from {table} where date < ?", [before])
+        return rows[0]["date"] if rows and rows[0]["date"] else None
+
+    def delete_batch(self, table, date, limit):
+        return self._execute(
+            f"delete from {table} where id in (select id from {table} where date = ? limit ?)", [date, limit]
+        )
+
+    def delete_all(self, table):
+        return self._execute(f"delete from {table}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# -------------------- In-memory --------------------
+class MemoryStorage:
+    """Process-local tables (benchmarks, dry runs)"""
+    name = "memory"
+    breaker = None
+
+    def __init__(self):
+        self._tables = {}
+        self._next_id = 1
+        self._lock = Lock()
+
+    def rows(self, table):
+        with self._lock:
+            return [dict(row) for row in self._tables.get(table, [])]
+
+    def select(self, table, dates, since=None):
+        dates = set(dates)
+        return [
+            row for row in self.rows(table)
+            if str(row["date"]) in dates and (not since or (row.get("last_checked") or "") >= since)
+        ]
+
+    def load_latest(self, table, dates, since):
+        rows = [row for row in self.select(table, dates) if (row.get("last_checked") or "") >= since]
+        return newest_snapshot_rows(rows)
+
+    def insert(self, table, rows, on_conflict=None):
+        keys = [c.strip() for c in on_conflict.split(",")] if on_conflict else None
+        with self._lock:
+            stored = self._tables.setdefault(table, [])
+            index = {tuple(row[k] for k in keys): row for row in stored} if keys else {}
+            for row in rows:
+                existing = index.get(tuple(row[k] for k in keys)) if keys else None
+                if existing is not None:
+                    existing.update(row)
+                    continue
+                new_row = {"id": self._next_id, **row}
+                self._next_id += 1
+                stored.append(new_row)
+                if keys:
+                    index[tuple(row[k] for k in keys)] = new_row
+        return len(rows)
+
+    def _delete_where(self, table, predicate):
+        with self._lock:
+            stored = self._tables.get(table, [])
+            kept = [row for row in stored if not predicate(row)]
+            self._tables[table] = kept
+            return len(stored) - len(kept)
+
+    def prune(self, table, district, date, keep_names):
+        keep = set(keep_names)
+        self._delete_where(
+            table,
+            lambda row: row["district"] == district and str(row["date"]) == str(date) and row["name"] not in keep,
+        )
+
+    def delete_before(self, table, date):
+        return self._delete_where(table, lambda row: str(row["date"]) < date)
+
+    def oldest_date(self, table, before):
+        dates = [str(row["date"]) for row in self.rows(table) if str(row["date"]) < before]
+        return min(dates) if dates else None
+
+    def delete_batch(self, table, date, limit):
+        deleted = 0
+
+        def _in_batch(row):
+            nonlocal deleted
+            if deleted < limit and str(row["date"]) == date:
+                deleted += 1
+                return True
+            return False
+
+        return self._delete_where(table, _in_batch)
+
+    def delete_all(self, table):
+        return self._delete_where(table, lambda row: True)
+
+# -------------------- Registry --------------------
+BACKENDS = {
+    "supabase": SupabaseStorage,
+    "sqlite": SQLiteStorage,
+    "memory": MemoryStorage,
+}
+
+def _build_storage():
+    if STORAGE_BACKEND not in BACKENDS:
+        raise ValueError(f"⚠️ Unknown SLOT_STORAGE_BACKEND {STORAGE_BACKEND!r} (expected one of {', '.join(BACKENDS)})")
+    print(f"🗄️  Slot storage backend: {STORAGE_BACKEND}")
+    return BACKENDS[STORAGE_BACKEND]()
+
+clients.register("storage", _build_storage, close=lambda storage: getattr(storage, "close", lambda: None)())
+
+def get_storage():
+    """Configured storage backend (clients.set("storage", ...) replaces it)"""
+    return clients.get("storage")
@@ -0,0 +1,41 @@
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from adaptive_polling import AdaptivePoller, STABLE_CHECKS
+from schedule_config import ScheduleProfile, DEFAULT_PROFILE
+
+KEY = ("Kathmandu", "2026-01-01")
+
+def _stable(poller, checks):
+    for _ in range(checks):
+        poller.record(KEY, changed=False)
+
+def test_stable_keys_back_off_and_changes_reset():
+    poller = AdaptivePoller(enabled=True)
+    assert poller.interval_for(KEY, 60) == 60
+    _stable(poller, STABLE_CHECKS)
+    assert poller.interval_for(KEY, 60) == 120
+    poller.record(KEY, changed=True)
+    assert poller.interval_for(KEY, 60) == 60
+
+def test_claim_without_backoff_uses_the_base_interval():
+    poller = AdaptivePoller(enabled=True)
+    _stable(poller, STABLE_CHECKS * 3)
+    assert poller.claim(KEY, 60)
+    time.sleep(0.01)
+    assert not poller.claim(KEY, 0.005)
+    assert poller.claim(KEY, 0.005, backoff=False)
+
+def test_prune_keeps_live_keys():
+    poller = AdaptivePoller(enabled=True)
+    _stable(poller, STABLE_CHECKS)
+    poller.prune([KEY])
+    assert poller.interval_for(KEY, 60) == 120
+    poller.prune([])
+    assert poller.interval_for(KEY, 60) == 60
+
+def test_profile_reports_the_active_window():
+    profile = ScheduleProfile(DEFAULT_PROFILE)
+    nepal = ZoneInfo("Asia/Kathmandu")
+    assert profile.window_for("Kathmandu", datetime(2026, 1, 5, 10, 2, tzinfo=nepal)).name == "morning release"
+    assert profile.window_for("Kathmandu", datetime(2026, 1, 5, 12, 0, tzinfo=nepal)) is None
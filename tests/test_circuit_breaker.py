@@ -0,0 +1,101 @@
+import time
+import pytest
+from circuit_breaker import CircuitBreaker, CircuitOpenError, is_transient_error, CLOSED, OPEN, HALF_OPEN
+
+def _breaker(threshold=3, reset=10.0):
+    return CircuitBreaker("test", failure_threshold=threshold, reset_seconds=reset, max_reset_seconds=60.0)
+
+def _expire(breaker):
+    breaker._open_until = time.monotonic() - 1
+
+def test_opens_after_threshold():
+    breaker = _breaker()
+    for _ in range(2):
+        breaker.record_failure("boom")
+    assert breaker.state == CLOSED
+    breaker.record_failure("boom")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+def test_failures_while_open_do_not_extend_the_open_period():
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_failure("boom")
+    open_until = breaker._open_until
+    for _ in range(10):
+        breaker.record_failure("late failure")
+    assert breaker._open_until == open_until
+    assert breaker._opens == 1
+
+def test_half_open_allows_a_single_probe():
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_failure("boom")
+    _expire(breaker)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+def test_failed_probe_reopens_with_longer_period():
+    breaker = _breaker(reset=10.0)
+    for _ in range(3):
+        breaker.record_failure("boom")
+    _expire(breaker)
+    assert breaker.allow()
+    breaker.record_failure("probe failed")
+    assert breaker.state == OPEN
+    assert breaker._opens == 2
+    # second period is 20s +-20% jitter
+    assert breaker.retry_in() >= 15.0
+
+def test_successful_probe_closes():
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_failure("boom")
+    _expire(breaker)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.retry_in() == 0.0
+
+def test_non_transient_error_only_frees_the_probe():
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_failure("boom")
+    _expire(breaker)
+    assert breaker.allow()
+    breaker.record_error(ValueError("bad request"))
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+def test_postgrest_error_classification():
+    APIError = pytest.importorskip("postgrest.exceptions").APIError
+
+    # Non-JSON gateway responses carry the HTTP status as code
+    assert is_transient_error(APIError({"code": 502, "message": "JSON could not be generated"}))
+    assert is_transient_error(APIError({"code": "503"}))
+    assert is_transient_error(APIError({"code": 429}))
+    assert not is_transient_error(APIError({"code": 404}))
+    # JSON error without a code (proxy / gateway)
+    assert is_transient_error(APIError({"message": "upstream timed out"}))
+    # Database codes
+    assert is_transient_error(APIError({"code": "57014"}))
+    assert is_transient_error(APIError({"code": "PGRST001"}))
+    assert not is_transient_error(APIError({"code": "23505"}))
+    assert not is_transient_error(APIError({"code": "PGRST202"}))
+    assert not is_transient_error(ValueError("bad input"))
+
+def test_data_rejection_classification():
+    from circuit_breaker import is_data_rejection
+    APIError = pytest.importorskip("postgrest.exceptions").APIError
+
+    assert is_data_rejection(APIError({"code": "23505"}))
+    assert is_data_rejection(APIError({"code": "22P02"}))
+    assert is_data_rejection(APIError({"code": "PGRST204"}))
+    assert is_data_rejection(APIError({"code": 400}))
+    assert not is_data_rejection(APIError({"code": 429}))
+    assert not is_data_rejection(APIError({"code": 503}))
+    assert not is_data_rejection(APIError({"message": "gateway"}))
+    assert not is_data_rejection(RuntimeError("unknown"))
@@ -0,0 +1,49 @@
+import leader
+from leader import FileLock, build_lock
+
+def test_file_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "poller.lock")
+    first, second = FileLock(path), FileLock(path)
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+def test_file_mode_without_file_locking_falls_back_to_none(monkeypatch):
+    monkeypatch.setattr(leader, "LEADER_ELECTION", "file")
+    monkeypatch.setattr(leader, "fcntl", None)
+    monkeypatch.setattr(leader, "msvcrt", None)
+    lock = build_lock()
+    assert lock.acquire()
+
+def test_slow_callbacks_do_not_block_renewal():
+    import threading
+    import time
+    from leader import LeaderElector
+
+    class CountingLock:
+        renewals = 0
+
+        def acquire(self):
+            self.renewals += 1
+            return True
+
+        def release(self):
+            pass
+
+    release = threading.Event()
+    calls = []
+    lock = CountingLock()
+    elector = LeaderElector(
+        lock,
+        on_elected=lambda: (calls.append("elected"), release.wait(5)),
+        on_demoted=lambda: calls.append("demoted"),
+        retry_seconds=0.01, renew_seconds=0.01,
+    )
+    elector.start()
+    time.sleep(0.2)
+    assert lock.renewals > 3
+    release.set()
+    elector.stop()
+    assert calls == ["elected", "demoted"]
@@ -0,0 +1,21 @@
+from notifier import SlackNotifier
+
+def _notifier():
+    notifier = SlackNotifier(post=lambda text: None)
+    # Keep messages queued - these tests only look at what enqueue() accepts
+    notifier._ensure_started = lambda: None
+    return notifier
+
+def test_repeated_notices_are_deduplicated():
+    notifier = _notifier()
+    assert notifier.enqueue("⏳ Waiting room for Kathmandu")
+    assert not notifier.enqueue("⏳ Waiting room for Kathmandu")
+    assert notifier.pending() == 1
+
+def test_slot_changes_are_never_deduplicated():
+    notifier = _notifier()
+    back = "🎉 *New/Changed Passport Slots*\n\n📍 *Kathmandu* — *2026-01-01*:\n• 🆕 `09:00` — Normal: 1 | VIP: 0"
+    gone = "🎉 *New/Changed Passport Slots*\n\n📍 *Kathmandu* — *2026-01-01*:\n• ❌ `09:00` — gone"
+    for message in (back, gone, back, gone):
+        assert notifier.enqueue(message, dedupe=False)
+    assert notifier.pending() == 4
@@ -0,0 +1,53 @@
+import pytest
+import utils
+from clients import clients
+from storage import MemoryStorage
+
+@pytest.fixture
+def storage(monkeypatch):
+    memory = MemoryStorage()
+    clients.set("storage", memory)
+    monkeypatch.setattr(utils, "SPOOL_MODE", "false")
+    monkeypatch.setattr(utils, "STORAGE_MODE", "append")
+    yield memory
+    clients.set("storage", None)
+
+def _slots(*names):
+    return [{"name": name, "capacity": 3, "vipCapacity": 0, "status": True} for name in names]
+
+def test_append_mode_clears_fully_booked_keys(storage):
+    utils.persist_available_slots(
+        {"Kathmandu": {"2026-01-01": _slots("09:00", "10:00")}, "Lalitpur": {"2026-01-01": _slots("09:00")}},
+        {},
+    )
+    utils.persist_available_slots({}, {"Kathmandu": {"2026-01-01": []}})
+
+    loaded = utils.load_last_slots(valid_dates=["2026-01-01"])
+    assert "Kathmandu" not in loaded
+    assert [slot["name"] for slot in loaded["Lalitpur"]["2026-01-01"]] == ["09:00"]
+
+def test_load_overlays_spooled_writes_without_waiting(storage, monkeypatch, tmp_path):
+    import time
+    from spool import WriteSpool
+
+    def store_down(record):
+        raise ConnectionError("store down")
+
+    down_spool = WriteSpool(str(tmp_path), apply=store_down)
+    clients.set("spool", down_spool)
+    monkeypatch.setattr(utils, "SPOOL_MODE", "true")
+    try:
+        utils.persist_available_slots({"Kathmandu": {"2026-01-01": _slots("09:00")}}, {})
+        utils.persist_available_slots({"Kathmandu": {"2026-01-01": _slots("10:00", "11:00")}}, {})
+        utils.persist_available_slots({"Lalitpur": {"2026-01-01": _slots("09:00")}}, {})
+        utils.persist_available_slots({}, {"Lalitpur": {"2026-01-01": []}})
+
+        started = time.monotonic()
+        loaded = utils.load_last_slots(valid_dates=["2026-01-01"])
+        assert time.monotonic() - started < 1
+        assert sorted(slot["name"] for slot in loaded["Kathmandu"]["2026-01-01"]) == ["10:00", "11:00"]
+        assert "Lalitpur" not in loaded
+        assert storage.rows("slots_available") == []
+    finally:
+        down_spool.close()
+        clients.set("spool", None)
@@ -0,0 +1,42 @@
+import slot_state as slot_state_module
+from slot_state import SlotStateStore
+
+def _slots(*names):
+    return [{"name": name, "capacity": 1, "vipCapacity": 0, "status": True} for name in names]
+
+class _Loader:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self, raise_on_error=False, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("store down")
+        return {"Kathmandu": {"2026-01-01": _slots("09:00")}}
+
+def test_lookups_never_load():
+    loader = _Loader()
+    store = SlotStateStore(loader=loader)
+    assert not store.get_snapshot("Kathmandu", "2026-01-01")
+    assert loader.calls == 0
+    store.ensure_loaded()
+    assert [slot.name for slot in store.get_snapshot("Kathmandu", "2026-01-01")] == ["09:00"]
+    assert loader.calls == 1
+
+def test_failed_reconcile_backs_off(monkeypatch):
+    loader = _Loader()
+    store = SlotStateStore(loader=loader, reconcile_seconds=0)
+    store.ensure_loaded()
+    loader.fail = True
+    for _ in range(5):
+        store.ensure_loaded()
+    # One failed attempt, then the retry wait
+    assert loader.calls == 2
+    assert [slot.name for slot in store.get_snapshot("Kathmandu", "2026-01-01")] == ["09:00"]
+
+    monkeypatch.setattr(slot_state_module, "RECONCILE_RETRY_SECONDS", 0)
+    store._retry_at = 0.0
+    loader.fail = False
+    store.ensure_loaded()
+    assert loader.calls == 3
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import pytest
+import spool
+from spool import WriteSpool, REJECTED_FILE
+
+APIError = pytest.importorskip("postgrest.exceptions").APIError
+
+@pytest.fixture(autouse=True)
+def _fast_retry(monkeypatch):
+    monkeypatch.setattr(spool, "REPLAY_INTERVAL_SECONDS", 0.05)
+    monkeypatch.setattr(spool, "backoff_delay", lambda attempt, base, cap: 0.05)
+
+def _insert(name):
+    return {"op": "insert", "table": "slots_available", "rows": [{"district": "D", "date": "2026-01-01", "name": name}]}
+
+def test_replays_records_in_order(tmp_path):
+    applied = []
+    write_spool = WriteSpool(str(tmp_path), apply=applied.append)
+    write_spool.append([_insert("a"), _insert("b")])
+    assert write_spool.flush(timeout=5)
+    write_spool.stop(timeout=1)
+    assert [row["name"] for record in applied for row in record["rows"]] == ["a", "b"]
+    assert not [n for n in os.listdir(tmp_path) if n.startswith("segment-")]
+
+def test_unclassified_errors_stay_in_the_spool(tmp_path):
+    failures = [RuntimeError("unknown failure")]
+    applied = []
+
+    def apply(record):
+        if failures:
+            raise failures.pop()
+        applied.append(record)
+
+    write_spool = WriteSpool(str(tmp_path), apply=apply)
+    write_spool.append([_insert("a")])
+    assert write_spool.flush(timeout=5)
+    write_spool.stop(timeout=1)
+    assert len(applied) == 1
+    assert not os.path.exists(tmp_path / REJECTED_FILE)
+
+def test_data_rejections_go_to_rejected_log(tmp_path):
+    rejected = []
+
+    def apply(record):
+        raise APIError({"code": "23502", "message": "null value in column"})
+
+    write_spool = WriteSpool(str(tmp_path), apply=apply, on_rejected=lambda record, error: rejected.append(record))
+    write_spool.append([_insert("a")])
+    assert write_spool.flush(timeout=5)
+    write_spool.stop(timeout=1)
+    assert len(rejected) == 1
+    assert os.path.exists(tmp_path / REJECTED_FILE)
+
+def test_records_left_by_a_previous_process_are_replayed(tmp_path):
+    first = WriteSpool(str(tmp_path), apply=lambda record: (_ for _ in ()).throw(ConnectionError("down")))
+    first.append([_insert("a")])
+    first.stop(timeout=0.3)
+
+    applied = []
+    second = WriteSpool(str(tmp_path), apply=applied.append)
+    assert second.pending() == 1
+    assert second.flush(timeout=5)
+    second.stop(timeout=1)
+    assert len(applied) == 1
+
+def test_only_one_process_replays_a_directory(tmp_path):
+    applied = []
+    leader = WriteSpool(str(tmp_path), apply=applied.append)
+    follower = WriteSpool(str(tmp_path), apply=applied.append)
+    assert leader.start()
+    assert not follower.start()
+
+    leader.append([_insert("a")])
+    assert leader.flush(timeout=5)
+    leader.stop(timeout=1)
+    # The follower takes over once the leader let go
+    assert follower.start()
+    follower.stop(timeout=1)
+    assert len(applied) == 1
+
+def test_replayer_leaves_segments_another_process_is_writing(tmp_path):
+    database_up = []
+    applied = []
+
+    def apply(record):
+        if not database_up:
+            raise ConnectionError("down")
+        applied.extend(row["name"] for row in record["rows"])
+
+    old_leader = WriteSpool(str(tmp_path), apply=apply)
+    old_leader.append([_insert("old")])
+    new_leader = WriteSpool(str(tmp_path), apply=apply)
+    new_leader.append([_insert("new-a")])
+
+    database_up.append(True)
+    assert old_leader.flush(timeout=5)
+    new_leader.append([_insert("new-b")])
+    assert applied == ["old"]
+
+    # Once the writer closes its segment the replayer takes it over
+    new_leader.close()
+    deadline = time.monotonic() + 5
+    while len(applied) < 3 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    old_leader.close()
+    assert applied == ["old", "new-a", "new-b"]
+
+def test_segments_of_a_dead_writer_are_adopted(tmp_path):
+    name = "segment-0000000007-999999.open"
+    with open(tmp_path / name, "w", encoding="utf-8") as handle:
+        handle.write(json.dumps(_insert("orphan")) + "\n")
+
+    applied = []
+    write_spool = WriteSpool(str(tmp_path), apply=applied.append)
+    assert write_spool.start()
+    deadline = time.monotonic() + 5
+    while not applied and time.monotonic() < deadline:
+        time.sleep(0.05)
+    write_spool.close()
+    assert [record["rows"][0]["name"] for record in applied] == ["orphan"]
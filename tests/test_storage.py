@@ -0,0 +1,103 @@
+import pytest
+import storage
+
+APIError = pytest.importorskip("postgrest.exceptions").APIError
+
+class _Query:
+    """Records a PostgREST select and serves it from a list of rows"""
+
+    def __init__(self, client, rows):
+        self.client = client
+        self.rows = rows
+        self.calls = []
+
+    def __getattr__(self, method):
+        def _record(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+            return self
+        return _record
+
+    def execute(self):
+        rows = list(self.rows)
+        for method, args, kwargs in self.calls:
+            if method == "in_":
+                rows = [row for row in rows if row[args[0]] in args[1]]
+            elif method == "gte":
+                rows = [row for row in rows if row[args[0]] >= args[1]]
+        for method, args, kwargs in reversed(self.calls):
+            if method == "order":
+                rows.sort(key=lambda row: row[args[0]], reverse=kwargs.get("desc", False))
+        for method, args, kwargs in self.calls:
+            if method == "range":
+                rows = rows[args[0]:args[1] + 1]
+        self.client.selects.append(self.calls)
+        return type("Response", (), {"data": rows})()
+
+class _FakeSupabase:
+    def __init__(self, rows=(), rpc_error=None):
+        self.rows = list(rows)
+        self.rpc_error = rpc_error
+        self.selects = []
+
+    def rpc(self, name, params):
+        raise self.rpc_error
+
+    def table(self, name):
+        return _Query(self, self.rows)
+
+def _run_rows(district, run, names, last_checked):
+    return [
+        {"id": run * 100 + i, "district": district, "date": "2026-01-01", "name": name,
+         "normal_capacity": 1, "vip_capacity": 0, "last_checked": last_checked}
+        for i, name in enumerate(names)
+    ]
+
+def test_fallback_pages_through_every_row(monkeypatch):
+    rows = (
+        _run_rows("Kathmandu", 1, ["09:00", "10:00", "11:00"], "2026-01-01T08:00")
+        + _run_rows("Kathmandu", 2, ["09:00"], "2026-01-01T09:00")
+        + _run_rows("Lalitpur", 3, ["10:00", "11:00"], "2026-01-01T07:00")
+    )
+    fake = _FakeSupabase(rows, rpc_error=APIError({"code": "PGRST202"}))
+    monkeypatch.setattr(storage, "get_supabase", lambda: fake)
+    monkeypatch.setattr(storage, "PAGE_SIZE", 2)
+
+    loaded = storage.SupabaseStorage().load_latest("slots_available", ["2026-01-01"], "2026-01-01T00:00")
+    assert sorted((row["district"], row["name"]) for row in loaded) == [
+        ("Kathmandu", "09:00"), ("Lalitpur", "10:00"), ("Lalitpur", "11:00"),
+    ]
+    # 6 rows in pages of 2, then an empty page
+    assert len(fake.selects) == 4
+
+def test_missing_rpc_falls_back_only_on_not_found(monkeypatch):
+    rows = _run_rows("Kathmandu", 1, ["09:00"], "2026-01-01T08:00")
+    supabase = storage.SupabaseStorage()
+
+    # An error inside the function is raised, the RPC stays in use
+    fake = _FakeSupabase(rows, rpc_error=APIError({"code": "57014", "message": "function timed out"}))
+    monkeypatch.setattr(storage, "get_supabase", lambda: fake)
+    with pytest.raises(APIError):
+        supabase.load_latest("slots_available", ["2026-01-01"], "2026-01-01T00:00")
+    assert supabase._rpc_available
+    assert fake.selects == []
+
+    # Function not found - the filtered select answers instead
+    fake = _FakeSupabase(rows, rpc_error=APIError({"code": "PGRST202"}))
+    monkeypatch.setattr(storage, "get_supabase", lambda: fake)
+    loaded = supabase.load_latest("slots_available", ["2026-01-01"], "2026-01-01T00:00")
+    assert [(row["district"], row["name"]) for row in loaded] == [("Kathmandu", "09:00")]
+    assert not supabase._rpc_available
+    methods = [(method, args) for method, args, kwargs in fake.selects[0]]
+    assert ("in_", ("date", ["2026-01-01"])) in methods
+    assert ("gte", ("last_checked", "2026-01-01T00:00")) in methods
+
+    # Later loads go straight to the select
+    fake.selects.clear()
+    supabase.load_latest("slots_available", ["2026-01-01"], "2026-01-01T00:00")
+    assert len(fake.selects) == 1
+
+def test_not_found_status_without_json_body_falls_back(monkeypatch):
+    fake = _FakeSupabase(_run_rows("Kathmandu", 1, ["09:00"], "2026-01-01T08:00"), rpc_error=APIError({"code": 404}))
+    monkeypatch.setattr(storage, "get_supabase", lambda: fake)
+    loaded = storage.SupabaseStorage().load_latest("slots_available", ["2026-01-01"], "2026-01-01T00:00")
+    assert [row["name"] for row in loaded] == ["09:00"]
@@ -0,0 +1,42 @@
+import waiting_room_handler
+from circuit_breaker import CircuitBreaker
+from waiting_room_handler import (
+    WaitingRoomQueue, WaitingRoomTask, attempt_waiting_room_task, RETRY_CIRCUIT_OPEN,
+)
+
+def _task(date="2026-01-01"):
+    return WaitingRoomTask("Kathmandu", "KTM", date, "https://example.invalid/timeslots")
+
+def test_one_task_per_key():
+    queue = WaitingRoomQueue()
+    assert queue.put(_task())
+    assert not queue.put(_task())
+    assert queue.qsize() == 1
+    assert queue.snapshot()["pending"][0]["detections"] == 2
+
+def test_retry_budget_per_cycle():
+    queue = WaitingRoomQueue(max_retries_per_cycle=1)
+    task = _task()
+    queue.put(task)
+    assert queue.reschedule(task, 0)
+    assert not queue.reschedule(task, 0)
+    # Waiting for an open circuit doesn't use the budget
+    assert queue.reschedule(task, 0, count_retry=False)
+    queue.start_cycle()
+    assert queue.reschedule(task, 0)
+
+def test_due_order():
+    queue = WaitingRoomQueue()
+    later, sooner = _task("2026-01-02"), _task("2026-01-01")
+    queue.put(later, delay=0.05)
+    queue.put(sooner)
+    assert queue.get() is sooner
+    assert queue.get() is later
+
+def test_open_circuit_is_not_an_attempt(monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=60)
+    breaker.record_failure("down")
+    monkeypatch.setattr(waiting_room_handler, "timeslot_breaker", breaker)
+    task = _task()
+    assert attempt_waiting_room_task(task) == RETRY_CIRCUIT_OPEN
+    assert task.attempts == 0
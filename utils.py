@@ -2,25 +2,86 @@ import os
 import time
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import requests
-from supabase import create_client
-from dotenv import load_dotenv
+import http_client
+from notifier import SlackNotifier
+from metrics import (
+    SUPABASE_WRITE_SECONDS,
+    SUPABASE_ROWS_WRITTEN,
+    SUPABASE_WRITE_ERRORS,
+    SLACK_POST_SECONDS,
+    SLACK_POSTS_TOTAL
+)
+from clients import clients, require_env
+from storage import get_storage, newest_snapshot_rows
+from spool import WriteSpool
+from schedule_days import get_valid_dates
+from slot_model import SlotSnapshot
+from circuit_breaker import supabase_breaker, slack_breaker, backoff_delay, is_transient_error
 
 # Nepal timezone
 NEPAL_TZ = ZoneInfo("Asia/Kathmandu")
 
-# -------------------- Environment --------------------
-load_dotenv(".env.dev")
-SLACK_WEBHOOK = os.environ.get("SLACK_WEBHOOK")
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+TABLE_NAME = "slots_available"
+UNAVAILABLE_TABLE_NAME = "slots_unavailable"
 
-if not SLACK_WEBHOOK or not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("⚠️ SLACK_WEBHOOK, SUPABASE_URL or SUPABASE_KEY not set!")
+# Rows per bulk insert request (PostgREST accepts a JSON array per POST)
+BULK_CHUNK_SIZE = int(os.environ.get("SUPABASE_BULK_CHUNK_SIZE", "500"))
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# -------------------- Storage mode --------------------
+# "append"      - every run inserts fresh rows into slots_available (default)
+# "incremental" - one current-state row per (district, date, name) in
+#                 slots_current, plus an append-only slot_changes log that is
+#                 only written for keys whose slots changed
+#
+# Tables needed for incremental mode:
+#   create table slots_current (
+#       id bigserial primary key,
+#       district text not null, date date not null, name text not null,
+#       normal_capacity int, vip_capacity int, last_checked timestamptz,
+#       unique (district, date, name)
+#   );
+#   create table slot_changes (
+#       id bigserial primary key,
+#       district text not null, date date not null,
+#       slots jsonb not null, diff jsonb, changed_at timestamptz not null
+#   );
+STORAGE_MODE = os.environ.get("SLOT_STORAGE_MODE", "append").lower()
+CURRENT_TABLE_NAME = "slots_current"
+CHANGES_TABLE_NAME = "slot_changes"
+CURRENT_CONFLICT_KEY = "district,date,name"
 
-TABLE_NAME = "slots_available"
+def is_incremental_mode():
+    return STORAGE_MODE == "incremental"
+
+# -------------------- Filtered loading --------------------
+# load_last_slots asks for the newest snapshot per (district, date) inside the
+# valid date window. Preferred path is this RPC (create it once in Supabase):
+#
+#   create index if not exists slots_available_latest_idx
+#       on slots_available (district, date, last_checked desc);
+#
+#   create or replace function latest_slot_snapshots(p_dates date[])
+#   returns setof slots_available language sql stable as $$
+#       select s.* from slots_available s
+#       join (
+#           select district, date, max(last_checked) as last_checked
+#           from slots_available where date = any(p_dates)
+#           group by district, date
+#       ) latest using (district, date, last_checked)
+#   $$;
+#
+# Without the RPC it falls back to a paged select limited to the valid dates
+# and the last LOAD_WINDOW_SECONDS of last_checked, reduced in Python. The
+# sqlite and memory backends (storage.py) run the same query locally.
+#
+# Append mode rewrites every key that still has slots whenever its cached
+# timeslot response expires (TIMESLOT_CACHE_MAX_AGE_SECONDS), and a stable
+# key is checked at least every ADAPTIVE_MAX_INTERVAL_SECONDS (also 30 min by
+# default) - so the newest run of a live key is within three cache max ages.
+LOAD_WINDOW_SECONDS = int(os.environ.get(
+    "SLOT_LOAD_WINDOW_SECONDS",
+    str(3 * int(os.environ.get("TIMESLOT_CACHE_MAX_AGE_SECONDS", "1800")))
+))
 
 HEADERS = {
     "Accept": "application/json, text/plain, */*",
@@ -42,48 +103,235 @@ HEADERS = {
 }
 
 # -------------------- Retry Helper --------------------
-def retry_operation(operation, max_retries=3, delay=2):
-    """Retry a database operation if it fails due to network issues"""
+def retry_operation(operation, max_retries=3, delay=2, breaker=supabase_breaker):
+    """
+    Retry a database operation on transient errors (timeouts, connection
+    failures, 5xx) with exponential backoff and jitter
+    Raises CircuitOpenError straight away while the breaker is open
+    (breaker=None for local storage without one)
+    """
     for attempt in range(1, max_retries + 1):
+        if breaker is not None:
+            breaker.check()
         try:
-            return operation()
+            result = operation()
         except Exception as e:
-            error_str = str(e).lower()
-            is_network_error = any(keyword in error_str for keyword in [
-                'winerror 10035', 'connection', 'timeout', 'socket', 'network', 'read error'
-            ])
-            
-            if is_network_error and attempt < max_retries:
-                print(f"⚠️ Network error (attempt {attempt}/{max_retries}), retrying...")
-                time.sleep(delay)
+            if breaker is not None:
+                breaker.record_error(e)
+            if is_transient_error(e) and attempt < max_retries and (breaker is None or breaker.state == "closed"):
+                wait = backoff_delay(attempt, delay)
+                print(f"⚠️ Network error (attempt {attempt}/{max_retries}), retrying in {wait:.1f}s...")
+                time.sleep(wait)
                 continue
-            else:
-                raise
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
 
 # -------------------- Slack --------------------
-def send_slack(message: str):
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def send_slack_now(message: str):
+    """Post straight to the webhook (used by the notifier thread); returns the response or None"""
+    started = time.perf_counter()
     try:
-        response = requests.post(SLACK_WEBHOOK, json={"text": f"[{ts}]\n{message}"}, timeout=10)
+        response = http_client.post(require_env("SLACK_WEBHOOK"), json={"text": message})
+        slack_breaker.record_response(response)
         if response.status_code == 200:
             print(f"✅ Slack sent")
+            SLACK_POSTS_TOTAL.inc(outcome="ok")
+        else:
+            SLACK_POSTS_TOTAL.inc(outcome=f"http_{response.status_code}")
+        return response
     except Exception as e:
         print(f"⚠️ Slack Error: {e}")
+        slack_breaker.record_error(e)
+        SLACK_POSTS_TOTAL.inc(outcome="error")
+        return None
+    finally:
+        SLACK_POST_SECONDS.observe(time.perf_counter() - started)
+
+clients.register(
+    "slack",
+    lambda: SlackNotifier(post=send_slack_now, breaker=slack_breaker),
+    close=lambda notifier: notifier.stop(),
+)
+
+def send_slack(message: str, dedupe=True):
+    """
+    Queue a Slack message - coalesced, deduplicated and sent in the background
+    dedupe=False for slot-change messages, which must never be dropped
+    """
+    clients.get("slack").enqueue(message, dedupe=dedupe)
+
+def flush_slack(timeout=30):
+    """Block until queued Slack messages are sent (shutdown) - no-op if nothing was ever queued"""
+    if not clients.is_built("slack"):
+        return True
+    return clients.get("slack").flush(timeout)
+
+# -------------------- Write spool --------------------
+# Writes go to a local append-only spool first and a background replayer
+# drains it to the storage backend in bulk, so cycle time does not depend on
+# remote database latency and nothing is lost while it is down.
+# SLOT_SPOOL: "auto" (only for remote backends), "true" or "false"
+SPOOL_MODE = os.environ.get("SLOT_SPOOL", "auto").lower()
+SPOOL_DIR = os.environ.get("SLOT_SPOOL_DIR", "spool")
+
+def is_spool_enabled():
+    if SPOOL_MODE == "auto":
+        return get_storage().breaker is not None
+    return SPOOL_MODE in ("1", "true", "yes")
+
+def _apply_spooled(record):
+    """Replay one spooled write against the storage backend (raises on failure)"""
+    storage = get_storage()
+    table_name = record["table"]
+    
+    if record["op"] == "prune":
+        def _prune():
+            return storage.prune(table_name, record["district"], record["date"], record["names"])
+        retry_operation(_prune, max_retries=2, delay=1, breaker=storage.breaker)
+        return
+    
+    rows = record["rows"]
+    started = time.perf_counter()
+    try:
+        written = retry_operation(
+            lambda: storage.insert(table_name, rows, on_conflict=record.get("on_conflict")),
+            max_retries=2, delay=1, breaker=storage.breaker
+        )
+        SUPABASE_ROWS_WRITTEN.inc(written, table=table_name)
+    except Exception:
+        SUPABASE_WRITE_ERRORS.inc(len(rows), table=table_name)
+        raise
+    finally:
+        SUPABASE_WRITE_SECONDS.observe(time.perf_counter() - started, table=table_name)
+
+def _report_rejected_write(record, error):
+    rows = record.get("rows") or []
+    send_slack(
+        f"⚠️ {get_storage().name} rejected a spooled write to `{record['table']}` "
+        f"({len(rows)} rows), kept in {SPOOL_DIR}/rejected.log: {str(error)[:200]}"
+    )
+
+clients.register(
+    "spool",
+    lambda: WriteSpool(SPOOL_DIR, apply=_apply_spooled, on_rejected=_report_rejected_write, batch_rows=BULK_CHUNK_SIZE),
+    close=lambda spool: spool.close(),
+)
+
+def get_spool():
+    return clients.get("spool")
+
+def start_spool_replayer():
+    """Start draining spooled writes, including those of a previous poller"""
+    if is_spool_enabled():
+        get_spool().start()
+
+def stop_spool_replayer(timeout=5):
+    """Stop replaying (lost poller leadership) so the new poller takes the spool over"""
+    if clients.is_built("spool"):
+        get_spool().stop(timeout)
+
+def flush_spool(timeout=30):
+    """Replay all spooled writes now (shutdown); True when nothing is left"""
+    if not clients.is_built("spool"):
+        return True
+    drained = get_spool().flush(timeout)
+    if not drained:
+        print(f"⚠️ {get_spool().pending()} spooled writes left in {SPOOL_DIR}, replayed on next start")
+    return drained
+
+def spool_status():
+    """Spool state for /health"""
+    if not clients.is_built("spool"):
+        return {"enabled": is_spool_enabled(), "pending": 0, "last_error": None}
+    spool = get_spool()
+    return {"enabled": True, "pending": spool.pending(), "last_error": spool.last_error}
 
 # -------------------- Slots helpers --------------------
-def load_last_slots():
-    """Load last slots from Supabase with retry logic"""
+def _load_rows(valid_dates, since=None):
+    """
+    Fetch only the rows needed to rebuild the last known state
+    With since, only keys written at or after it (delta on top of a snapshot)
+    """
+    storage = get_storage()
+    if is_incremental_mode():
+        # One row per (district, date, name) already - just filter the dates
+        return storage.select(CURRENT_TABLE_NAME, valid_dates, since)
+    
+    if since:
+        return newest_snapshot_rows(storage.select(TABLE_NAME, valid_dates, since))
+    
+    since = (datetime.now(NEPAL_TZ) - timedelta(seconds=LOAD_WINDOW_SECONDS)).isoformat()
+    return storage.load_latest(TABLE_NAME, valid_dates, since)
+
+def _overlay_spooled(rows, records, valid_dates):
+    """
+    Apply spooled writes (oldest first) to rows loaded from the store
+    append:      a newer run's rows replace the key's snapshot
+    incremental: rows are upserted per name
+    A prune drops the key's names that are not kept.
+    """
+    table = CURRENT_TABLE_NAME if is_incremental_mode() else TABLE_NAME
+    dates = set(valid_dates)
+    keys = {}
+    for row in rows:
+        keys.setdefault((row["district"], str(row["date"])), {})[row["name"]] = row
+    
+    for record in records:
+        if record.get("table") != table:
+            continue
+        if record["op"] == "prune":
+            key = (record["district"], str(record["date"]))
+            keep = set(record["names"])
+            if key in keys:
+                keys[key] = {name: row for name, row in keys[key].items() if name in keep}
+            continue
+        for row in record["rows"]:
+            key = (row["district"], str(row["date"]))
+            if key[1] not in dates:
+                continue
+            slots = keys.setdefault(key, {})
+            checked = row.get("last_checked") or ""
+            if not is_incremental_mode() and slots and checked > max(r.get("last_checked") or "" for r in slots.values()):
+                slots.clear()
+            slots[row["name"]] = row
+    
+    return [row for slots in keys.values() for row in slots.values()]
+
+def load_last_slots(raise_on_error=False, valid_dates=None, since=None):
+    """
+    Load the newest known slots per (district, date) for the valid dates
+    since (ISO timestamp) limits it to keys written from then on
+    Returns {} on failure unless raise_on_error is set
+    """
+    valid_dates = valid_dates or get_valid_dates()
+    
+    storage = get_storage()
+    
+    # Read our own writes without waiting for the replayer: writes still in
+    # the spool are laid over the loaded rows (read before the load, so a
+    # write replayed in between is seen at least once)
+    spooled = []
+    if clients.is_built("spool") and get_spool().pending():
+        spooled = get_spool().pending_records()
+    
     def _load():
-        response = supabase.table(TABLE_NAME).select("*").execute()
-        print(f"📥 Loaded {len(response.data)} rows from Supabase")
-        return response.data
+        data = _load_rows(valid_dates, since)
+        print(f"📥 Loaded {len(data)} rows from {storage.name}")
+        return data
     
     try:
-        data = retry_operation(_load, max_retries=3, delay=2)
+        data = retry_operation(_load, max_retries=3, delay=2, breaker=storage.breaker)
     except Exception as e:
-        print(f"❌ Supabase load error: {e}")
+        print(f"❌ {storage.name} load error: {e}")
+        if raise_on_error:
+            raise
         return {}
     
+    if spooled:
+        data = _overlay_spooled(data, spooled, valid_dates)
+    
     result = {}
     for row in data:
         district = row["district"]
@@ -98,49 +346,23 @@ def load_last_slots():
     
     return result
 
-def clean_old_slots():
-    """Delete slots from past dates"""
-    def _clean():
-        today = datetime.now().date()
-        yesterday = (today - timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        print(f"🧹 Cleaning slots before {yesterday}...")
-        
-        response1 = supabase.table("slots_available").delete().lt("date", yesterday).execute()
-        deleted_available = len(response1.data) if response1.data else 0
-        
-        response2 = supabase.table("slots_unavailable").delete().lt("date", yesterday).execute()
-        deleted_unavailable = len(response2.data) if response2.data else 0
-        
-        return deleted_available + deleted_unavailable
-    
-    try:
-        total_deleted = retry_operation(_clean, max_retries=3, delay=2)
-        if total_deleted > 0:
-            print(f"✅ Cleaned {total_deleted} old records")
-    except Exception as e:
-        print(f"⚠️ Error during cleanup: {e}")
-
 def delete_all_slots():
     """
     Delete ALL records from both tables
     Run this at midnight to clear the database
     """
+    storage = get_storage()
+    
     def _delete_all():
         print("🗑️ Deleting ALL records from database...")
         
-        # Delete from slots_available
-        response1 = supabase.table("slots_available").delete().neq("id", 0).execute()
-        deleted_available = len(response1.data) if response1.data else 0
-        
-        # Delete from slots_unavailable  
-        response2 = supabase.table("slots_unavailable").delete().neq("id", 0).execute()
-        deleted_unavailable = len(response2.data) if response2.data else 0
+        deleted_available = storage.delete_all(TABLE_NAME)
+        deleted_unavailable = storage.delete_all(UNAVAILABLE_TABLE_NAME)
         
         return deleted_available, deleted_unavailable
     
     try:
-        available, unavailable = retry_operation(_delete_all, max_retries=3, delay=2)
+        available, unavailable = retry_operation(_delete_all, max_retries=3, delay=2, breaker=storage.breaker)
         total = available + unavailable
         
         msg = f"🗑️ Midnight cleanup: Deleted {total} records ({available} available, {unavailable} unavailable)"
@@ -154,93 +376,207 @@ def delete_all_slots():
         send_slack(error_msg)
         return 0
 
+def _slot_rows(slots_dict, current_time):
+    """Flatten {district: {date: [slot, ...] or SlotSnapshot}} into table rows"""
+    rows = []
+    for district, dates in slots_dict.items():
+        for date, slots in dates.items():
+            for s in SlotSnapshot.coerce(slots):
+                rows.append({
+                    "district": district,
+                    "date": date,
+                    "name": s.name,
+                    "normal_capacity": s.capacity,
+                    "vip_capacity": s.vip_capacity,
+                    "last_checked": current_time
+                })
+    return rows
+
+def bulk_insert(table_name, rows, chunk_size=None, on_conflict=None):
+    """
+    Queue rows for the storage backend - through the write spool when it is
+    enabled (returns straight away), otherwise written directly
+    Returns (saved, failed_chunks) like write_rows
+    """
+    if is_spool_enabled():
+        chunk_size = chunk_size or BULK_CHUNK_SIZE
+        get_spool().append([
+            {"op": "insert", "table": table_name, "rows": rows[start:start + chunk_size], "on_conflict": on_conflict}
+            for start in range(0, len(rows), chunk_size)
+        ])
+        print(f"📼 Spooled {len(rows)} rows for {table_name}")
+        return len(rows), []
+    return write_rows(table_name, rows, chunk_size, on_conflict)
+
+def write_rows(table_name, rows, chunk_size=None, on_conflict=None):
+    """
+    Insert rows in chunked bulk requests (one round trip per chunk)
+    Each chunk is retried on its own; returns (saved, failed_chunks)
+    where failed_chunks is a list of (first_row_index, row_count, error)
+    Passing on_conflict turns the insert into an upsert on those columns
+    """
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    storage = get_storage()
+    saved = 0
+    failed_chunks = []
+    
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        
+        def _insert_chunk():
+            return storage.insert(table_name, chunk, on_conflict=on_conflict)
+        
+        started = time.perf_counter()
+        try:
+            written = retry_operation(_insert_chunk, max_retries=3, delay=1, breaker=storage.breaker)
+            if written:
+                saved += written
+                SUPABASE_ROWS_WRITTEN.inc(written, table=table_name)
+            else:
+                failed_chunks.append((start, len(chunk), "empty response"))
+                SUPABASE_WRITE_ERRORS.inc(len(chunk), table=table_name)
+        except Exception as e:
+            failed_chunks.append((start, len(chunk), str(e)))
+            SUPABASE_WRITE_ERRORS.inc(len(chunk), table=table_name)
+            print(f"❌ Failed to insert rows {start}-{start + len(chunk) - 1} into {table_name}: {e}")
+        finally:
+            SUPABASE_WRITE_SECONDS.observe(time.perf_counter() - started, table=table_name)
+    
+    return saved, failed_chunks
+
+def _report_failed_chunks(table_name, rows, failed_chunks):
+    """Send one Slack summary for the chunks that could not be written"""
+    if not failed_chunks:
+        return
+    
+    lost = sum(count for _, count, _ in failed_chunks)
+    lines = [f"⚠️ {get_storage().name} insert into `{table_name}`: {len(failed_chunks)} chunk(s) failed, {lost}/{len(rows)} rows not saved"]
+    for start, count, error in failed_chunks[:5]:
+        first = rows[start]
+        lines.append(f"• rows {start}-{start + count - 1} (from {first['district']}/{first['date']}): {error[:120]}")
+    send_slack("\n".join(lines))
+
 def save_last_slots(slots_dict):
     """
     ALWAYS INSERT new records (never update existing ones)
-    Each run creates fresh database entries
+    Each run creates fresh database entries, written in chunked bulk inserts
     """
     if not slots_dict:
         print("⚠️ Empty slots_dict - skipping save")
         return
     
-    print(f"💾 Inserting NEW slots to Supabase...")
+    rows = _slot_rows(slots_dict, datetime.now(NEPAL_TZ).isoformat())
+    print(f"💾 Inserting {len(rows)} NEW slots to {get_storage().name}...")
+    
+    saved, failed_chunks = bulk_insert(TABLE_NAME, rows)
+    errors = len(rows) - saved
+    
+    print(f"✅ Insert complete: {saved} new records, {errors} errors")
+    _report_failed_chunks(TABLE_NAME, rows, failed_chunks)
+    
+    return saved, errors
+
+def prune_slots(table_name, district, date, keep_names):
+    """
+    Delete the rows of one (district, date) whose name is not in keep_names
+    (all of them when it is empty) - through the spool when it is enabled
+    """
+    if is_spool_enabled():
+        get_spool().append([{"op": "prune", "table": table_name, "district": district, "date": date, "names": keep_names}])
+        return
+    
+    storage = get_storage()
+    
+    def _prune():
+        return storage.prune(table_name, district, date, keep_names)
+    
+    try:
+        retry_operation(_prune, max_retries=3, delay=1, breaker=storage.breaker)
+    except Exception as e:
+        print(f"⚠️ Failed to prune {district}/{date} in {table_name}: {e}")
+
+def save_changed_slots(changed_dict, diffs=None):
+    """
+    Incremental mode write path - only called for (district, date) keys whose
+    slots changed. Upserts the current-state rows, removes names that are no
+    longer offered and appends one slot_changes entry per key, with the
+    structured diff from diffs[(district, date)] when given.
+    An empty slot list clears the key.
+    """
+    diffs = diffs or {}
+    if not changed_dict:
+        return 0, 0
     
-    saved = 0
-    errors = 0
     current_time = datetime.now(NEPAL_TZ).isoformat()
+    rows = _slot_rows(changed_dict, current_time)
     
-    for district, dates in slots_dict.items():
-        for date, slots in dates.items():
-            for s in slots:
-                def _save_slot():
-                    row = {
-                        "district": district,
-                        "date": date,
-                        "name": s.get("name", "UNKNOWN"),
-                        "normal_capacity": s.get("capacity", 0),
-                        "vip_capacity": s.get("vipCapacity", 0),
-                        "last_checked": current_time
-                    }
-                    
-                    # Changed from upsert to insert - creates new record every time
-                    return supabase.table(TABLE_NAME).insert(row).execute()
-                
-                try:
-                    response = retry_operation(_save_slot, max_retries=3, delay=1)
-                    if response.data:
-                        saved += 1
-                    else:
-                        errors += 1
-                except Exception as e:
-                    errors += 1
-                    print(f"❌ Failed to save {district}/{date}/{s.get('name')}: {e}")
+    saved, failed_chunks = bulk_insert(CURRENT_TABLE_NAME, rows, on_conflict=CURRENT_CONFLICT_KEY)
+    _report_failed_chunks(CURRENT_TABLE_NAME, rows, failed_chunks)
     
-    print(f"✅ Insert complete: {saved} new records, {errors} errors")
+    change_rows = []
+    for district, dates in changed_dict.items():
+        for date, slots in dates.items():
+            snapshot = SlotSnapshot.coerce(slots)
+            names = [s.name for s in snapshot]
+            
+            prune_slots(CURRENT_TABLE_NAME, district, date, names)
+            
+            change_rows.append({
+                "district": district,
+                "date": date,
+                "slots": [
+                    {"name": s.name, "capacity": s.capacity, "vipCapacity": s.vip_capacity}
+                    for s in snapshot
+                ],
+                "diff": diffs[(district, date)].to_dict() if (district, date) in diffs else None,
+                "changed_at": current_time
+            })
     
-    if errors > 0:
-        send_slack(f"⚠️ Supabase insert had {errors} errors")
+    logged, failed_log_chunks = bulk_insert(CHANGES_TABLE_NAME, change_rows)
+    if failed_log_chunks:
+        print(f"⚠️ {len(change_rows) - logged} change log entries not saved")
     
-    return saved, errors
+    print(f"✅ Incremental save: {saved} current rows, {logged} change log entries")
+    return saved, len(rows) - saved
 
-def slots_changed(prev, current):
-    """Return True if any slot has changed"""
-    if not prev:
-        return True
+def persist_available_slots(all_slots, changed_slots, diffs=None):
+    """
+    Write available slots according to SLOT_STORAGE_MODE
+    append:      insert every slot seen this run (bumps last_checked);
+                 keys that became fully booked lose their rows, otherwise
+                 the last snapshot would be loaded again after a restart
+    incremental: upsert + change log for the changed keys only
+    """
+    if is_incremental_mode():
+        if not changed_slots:
+            print("ℹ️  Incremental mode: nothing changed, no writes")
+            return 0, 0
+        return save_changed_slots(changed_slots, diffs)
     
-    prev_map = {s["name"]: (s["capacity"], s["vipCapacity"]) for s in prev}
-    curr_map = {s.get("name"): (s.get("capacity", 0), s.get("vipCapacity", 0)) for s in current}
+    for district, dates in (changed_slots or {}).items():
+        for date, slots in dates.items():
+            if not SlotSnapshot.coerce(slots):
+                prune_slots(TABLE_NAME, district, date, [])
+                print(f"🧹 Cleared {district} on {date} from {TABLE_NAME}")
     
-    return prev_map != curr_map
+    if not all_slots:
+        print("   No available slots to save")
+        return 0, 0
+    return save_last_slots(all_slots)
 
 def save_unavailable_slots(slots_dict):
-    """Save unavailable slots - also changed to insert"""
+    """Save unavailable slots - bulk inserted like save_last_slots"""
     if not slots_dict:
         return
     
-    total_saved = 0
-    current_time = datetime.now(NEPAL_TZ).isoformat()
+    rows = _slot_rows(slots_dict, datetime.now(NEPAL_TZ).isoformat())
+    if not rows:
+        return
     
-    for district, dates in slots_dict.items():
-        for date, slots in dates.items():
-            for s in slots:
-                def _save_unavailable():
-                    row = {
-                        "district": district,
-                        "date": date,
-                        "name": s.get("name", "UNKNOWN"),
-                        "normal_capacity": s.get("capacity", 0),
-                        "vip_capacity": s.get("vipCapacity", 0),
-                        "last_checked": current_time
-                    }
-                    
-                    # Changed from upsert to insert
-                    return supabase.table("slots_unavailable").insert(row).execute()
-                
-                try:
-                    retry_operation(_save_unavailable, max_retries=3, delay=1)
-                    total_saved += 1
-                except Exception as e:
-                    print(f"⚠️ Failed to save unavailable: {e}")
+    total_saved, failed_chunks = bulk_insert(UNAVAILABLE_TABLE_NAME, rows)
+    _report_failed_chunks(UNAVAILABLE_TABLE_NAME, rows, failed_chunks)
     
     if total_saved > 0:
-        print(f"💾 Saved {total_saved} unavailable slots")
\ No newline at end of file
+        print(f"💾 Saved {total_saved} unavailable slots")
+    
+    return total_saved, len(rows) - total_saved
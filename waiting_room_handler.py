@@ -1,20 +1,38 @@
-import time
+import os
 import json
-import requests
+import heapq
+import time
+import traceback
+import http_client
+from collections import OrderedDict
 from datetime import datetime
-from threading import Thread
-from queue import Queue
+from threading import Condition, Thread
 from utils import (
-    load_last_slots,
-    save_last_slots,
+    persist_available_slots,
     save_unavailable_slots,
     send_slack,
-    slots_changed,
     HEADERS
 )
+from slot_state import slot_state
+from slot_model import SlotSnapshot, diff_snapshots
+from notifier import format_slot_changes
+from circuit_breaker import timeslot_breaker
 
-# Queue to hold waiting room tasks
-waiting_room_queue = Queue()
+# -------------------- Configuration --------------------
+WORKERS = int(os.environ.get("WAITING_ROOM_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.environ.get("WAITING_ROOM_MAX_ATTEMPTS", "3"))
+RETRY_SECONDS = float(os.environ.get("WAITING_ROOM_RETRY_SECONDS", "10"))
+# Hard cap on upstream retries (not first attempts) per check cycle
+MAX_RETRIES_PER_CYCLE = int(os.environ.get("WAITING_ROOM_MAX_RETRIES_PER_CYCLE", "30"))
+# Finished keys kept for /waiting_room_queue
+HISTORY_SIZE = int(os.environ.get("WAITING_ROOM_HISTORY_SIZE", "50"))
+
+# Outcome of one attempt
+DONE = "done"
+RETRY_WAITING_ROOM = "waiting_room"
+RETRY_ERROR = "error"
+# Timeslot API circuit open - not an attempt, waits for the breaker
+RETRY_CIRCUIT_OPEN = "circuit_open"
 
 class WaitingRoomTask:
     def __init__(self, district_name, code, date, url):
@@ -23,106 +41,139 @@ class WaitingRoomTask:
         self.date = date
         self.url = url
         self.timestamp = datetime.now()
+        self.attempts = 0
+        # Registry bookkeeping
+        self.state = "queued"
+        self.detections = 1
+        self.last_detected = self.timestamp
+        self.last_outcome = None
+        self.due = None
+        self.finished_at = None
+
+    @property
+    def key(self):
+        return (self.district_name, self.date)
+
+    def refresh(self, code, url):
+        """Same (district, date) hit the waiting room again"""
+        self.code = code
+        self.url = url
+        self.detections += 1
+        self.last_detected = datetime.now()
+
+    def to_dict(self):
+        next_attempt_in = None
+        if self.due is not None and self.state in ("queued", "retry_wait"):
+            next_attempt_in = round(max(0.0, self.due - time.monotonic()), 1)
+        return {
+            "district": self.district_name,
+            "date": self.date,
+            "state": self.state,
+            "attempts": self.attempts,
+            "max_attempts": MAX_ATTEMPTS,
+            "detections": self.detections,
+            "first_detected": self.timestamp.isoformat(timespec="seconds"),
+            "last_detected": self.last_detected.isoformat(timespec="seconds"),
+            "last_outcome": self.last_outcome,
+            "next_attempt_in": next_attempt_in,
+            "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+        }
 
-def process_waiting_room_task(task: WaitingRoomTask):
+def attempt_waiting_room_task(task: WaitingRoomTask):
     """
-    Process a single waiting room task
-    Retries 3 times over 30 seconds (10 second intervals)
+    One attempt at a waiting room task - never sleeps between retries,
+    the queue re-schedules the task instead
+    Returns DONE, RETRY_WAITING_ROOM, RETRY_ERROR or RETRY_CIRCUIT_OPEN
     """
-    print(f"🕐 Handling waiting room for {task.district_name} on {task.date}")
+    # API is down - retry later without spending an attempt
+    if not timeslot_breaker.allow():
+        return RETRY_CIRCUIT_OPEN
     
-    max_attempts = 3
-    check_interval = 10  # seconds
+    task.attempts += 1
+    elapsed = (datetime.now() - task.timestamp).total_seconds()
+    print(f"⏳ Attempt {task.attempts}/{MAX_ATTEMPTS} for {task.district_name} on {task.date} (elapsed: {elapsed:.0f}s)")
     
-    for attempt in range(1, max_attempts + 1):
-        elapsed = (datetime.now() - task.timestamp).total_seconds()
-        print(f"⏳ Retry {attempt}/{max_attempts} for {task.district_name} on {task.date} (elapsed: {elapsed:.0f}s)")
-        
+    try:
+        http_client.rate_limiter.wait(http_client.host_of(task.url))
         try:
-            response = requests.get(task.url, headers=HEADERS, timeout=10)
-            text = response.text
-            
-            # Still in waiting room?
-            if "Online Waiting Room" in text:
-                if attempt < max_attempts:
-                    time.sleep(check_interval)
-                    continue
-                else:
-                    # Give up after max attempts
-                    msg = f"❌ Waiting room persisted for {task.district_name} on {task.date} after {elapsed:.0f}s. Marking unavailable."
-                    print(msg)
-                    send_slack(msg)
+            response = http_client.get(task.url, headers=HEADERS)
+        except Exception as e:
+            timeslot_breaker.record_error(e)
+            raise
+        timeslot_breaker.record_response(response)
+        text = response.text
+        
+        # Still in waiting room?
+        if "Online Waiting Room" in text:
+            return RETRY_WAITING_ROOM
+        
+        # Got past waiting room!
+        if response.status_code == 200:
+            try:
+                slots = response.json()
+                
+                if not isinstance(slots, list) or len(slots) == 0:
+                    print(f"✓ Past waiting room but no slots for {task.district_name} on {task.date}")
                     mark_as_unavailable_due_to_waiting_room(task.district_name, task.date)
-                    return False
-            
-            # Got past waiting room!
-            if response.status_code == 200:
-                try:
-                    slots = response.json()
-                    
-                    if not isinstance(slots, list) or len(slots) == 0:
-                        print(f"✓ Past waiting room but no slots for {task.district_name} on {task.date}")
-                        mark_as_unavailable_due_to_waiting_room(task.district_name, task.date)
-                        return True
+                    return DONE
+                
+                # Process slots
+                available = [s for s in slots if isinstance(s, dict) and s.get("status")]
+                unavailable = [s for s in slots if isinstance(s, dict) and not s.get("status")]
+                
+                # Handle available slots
+                if available:
+                    current = SlotSnapshot.from_dicts(available)
+                    diff = diff_snapshots(slot_state.get_snapshot(task.district_name, task.date), current)
                     
-                    # Process slots
-                    available = [s for s in slots if isinstance(s, dict) and s.get("status")]
-                    unavailable = [s for s in slots if isinstance(s, dict) and not s.get("status")]
-                    
-                    # Handle available slots
-                    if available:
-                        last_slots = load_last_slots()
-                        prev_available = last_slots.get(task.district_name, {}).get(task.date, [])
+                    if diff:
+                        # Found slots after waiting room cleared!
+                        send_slack(
+                            "🎉 *SLOTS FOUND AFTER WAITING ROOM!*\n"
+                            + format_slot_changes(task.district_name, task.date, diff, current),
+                            dedupe=False
+                        )
                         
-                        if slots_changed(prev_available, available):
-                            # Found slots after waiting room cleared!
-                            msg_lines = [f"🎉 *SLOTS FOUND AFTER WAITING ROOM!*\n📍 *{task.district_name}* — *{task.date}*:\n"]
-                            for s in available:
-                                msg_lines.append(
-                                    f"• `{s.get('name','UNKNOWN')}` — Normal: {s.get('capacity',0)} | VIP: {s.get('vipCapacity',0)}"
-                                )
-                            send_slack("\n".join(msg_lines))
-                            
-                            # Save available slots
-                            last_slots.setdefault(task.district_name, {})[task.date] = available
-                            save_last_slots(last_slots)
-                            print(f"✓ Saved {len(available)} available slots for {task.district_name} on {task.date}")
-                        else:
-                            print(f"✓ No changes in available slots for {task.district_name} on {task.date}")
-                    
-                    # Save unavailable slots
-                    if unavailable:
-                        save_unavailable_slots({task.district_name: {task.date: unavailable}})
-                        print(f"✓ Saved {len(unavailable)} unavailable slots for {task.district_name} on {task.date}")
-                    
-                    return True
-                    
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ JSON decode error: {e}")
-                    if attempt < max_attempts:
-                        time.sleep(check_interval)
-                        continue
-                    return False
-            else:
-                print(f"⚠️ Status {response.status_code} for {task.district_name} on {task.date}")
-                if attempt < max_attempts:
-                    time.sleep(check_interval)
-                    continue
-            
-        except Exception as e:
-            print(f"⚠️ Error in waiting room handler: {e}")
-            if attempt < max_attempts:
-                time.sleep(check_interval)
-                continue
+                        # Save available slots
+                        changed = {task.district_name: {task.date: current}}
+                        persist_available_slots(changed, changed, {(task.district_name, task.date): diff})
+                        slot_state.set(task.district_name, task.date, current)
+                        print(f"✓ Saved {len(available)} available slots for {task.district_name} on {task.date}")
+                    else:
+                        print(f"✓ No changes in available slots for {task.district_name} on {task.date}")
+                
+                # Save unavailable slots
+                if unavailable:
+                    save_unavailable_slots({task.district_name: {task.date: unavailable}})
+                    print(f"✓ Saved {len(unavailable)} unavailable slots for {task.district_name} on {task.date}")
+                
+                return DONE
+                
+            except json.JSONDecodeError as e:
+                print(f"⚠️ JSON decode error: {e}")
+                return RETRY_ERROR
+        
+        print(f"⚠️ Status {response.status_code} for {task.district_name} on {task.date}")
+        return RETRY_ERROR
     
-    # If we get here, all retries failed
+    except Exception as e:
+        print(f"⚠️ Error in waiting room handler: {e}")
+        return RETRY_ERROR
+
+def give_up_waiting_room_task(task: WaitingRoomTask, outcome):
+    """All attempts (or the cycle's retry budget) used up"""
+    elapsed = (datetime.now() - task.timestamp).total_seconds()
+    if outcome == RETRY_WAITING_ROOM:
+        msg = f"❌ Waiting room persisted for {task.district_name} on {task.date} after {elapsed:.0f}s. Marking unavailable."
+        print(msg)
+        send_slack(msg)
+    else:
+        print(f"❌ Giving up on {task.district_name} on {task.date} after {task.attempts} attempts")
     mark_as_unavailable_due_to_waiting_room(task.district_name, task.date)
-    return False
 
 def mark_as_unavailable_due_to_waiting_room(district_name, date):
     """Mark previously available slots as unavailable"""
-    last_slots = load_last_slots()
-    prev_available = last_slots.get(district_name, {}).get(date, [])
+    prev_available = slot_state.get(district_name, date)
     
     if prev_available:
         unavailable_slots = []
@@ -137,37 +188,211 @@ def mark_as_unavailable_due_to_waiting_room(district_name, date):
         
         save_unavailable_slots({district_name: {date: unavailable_slots}})
         
-        # Clear from last_slots
-        if district_name in last_slots and date in last_slots[district_name]:
-            del last_slots[district_name][date]
-            save_last_slots(last_slots)
+        # Clear the key in storage (either mode) and in the slot state
+        persist_available_slots({}, {district_name: {date: []}})
+        slot_state.remove(district_name, date)
         
         print(f"✓ Marked slots as unavailable for {district_name} on {date}")
 
+class WaitingRoomQueue:
+    """
+    Deferred-retry task queue and keyed registry for the waiting room workers
+
+    Tasks sit in a heap ordered by due time. Workers block on a condition
+    until the earliest task is due, so a task waiting for its retry never
+    occupies a worker. The registry holds one task per (district, date):
+    a new detection refreshes the pending task instead of adding another.
+    At most MAX_RETRIES_PER_CYCLE re-schedules per check cycle.
+    """
+
+    def __init__(self, max_retries_per_cycle=MAX_RETRIES_PER_CYCLE):
+        self.max_retries_per_cycle = max_retries_per_cycle
+        self._heap = []
+        self._seq = 0
+        self._tasks = {}
+        self._history = OrderedDict()
+        self._cond = Condition()
+        self._retries_this_cycle = 0
+        self._unfinished = 0
+        self._stopping = False
+        self._paused = False
+
+    def _push(self, task, delay):
+        self._seq += 1
+        task.due = time.monotonic() + delay
+        heapq.heappush(self._heap, (task.due, self._seq, task))
+        self._cond.notify()
+
+    def put(self, task, delay=0.0):
+        """
+        Register a task; returns False when a task for the same key is
+        already pending - that one is refreshed instead
+        """
+        with self._cond:
+            existing = self._tasks.get(task.key)
+            if existing is not None:
+                existing.refresh(task.code, task.url)
+                return False
+            self._tasks[task.key] = task
+            self._history.pop(task.key, None)
+            self._unfinished += 1
+            task.state = "queued"
+            self._push(task, delay)
+            return True
+
+    def reschedule(self, task, delay=RETRY_SECONDS, count_retry=True):
+        """
+        Put a task back with a due time; False when the cycle's retry budget
+        is spent (count_retry=False re-queues without touching the budget)
+        """
+        with self._cond:
+            if count_retry:
+                if self._retries_this_cycle >= self.max_retries_per_cycle:
+                    return False
+                self._retries_this_cycle += 1
+            task.state = "retry_wait"
+            self._push(task, delay)
+            return True
+
+    def get(self):
+        """Block until a task is due; None once stop() was called"""
+        with self._cond:
+            while not self._stopping:
+                if self._paused:
+                    self._cond.wait()
+                elif self._heap:
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        task = heapq.heappop(self._heap)[2]
+                        task.state = "running"
+                        return task
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+            return None
+
+    def task_done(self, task, state="done"):
+        """Task finished for good - state is done, gave_up or error"""
+        with self._cond:
+            self._tasks.pop(task.key, None)
+            task.state = state
+            task.due = None
+            task.finished_at = datetime.now()
+            self._history[task.key] = task
+            while len(self._history) > HISTORY_SIZE:
+                self._history.popitem(last=False)
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def start_cycle(self):
+        """Reset the retry budget - called at the start of every check"""
+        with self._cond:
+            self._retries_this_cycle = 0
+
+    def qsize(self):
+        with self._cond:
+            return len(self._heap)
+
+    def snapshot(self):
+        """Per-key state for the API: pending tasks and recently finished ones"""
+        with self._cond:
+            return {
+                "pending": [task.to_dict() for task in self._tasks.values()],
+                "recent": [task.to_dict() for task in reversed(self._history.values())],
+                "retries_this_cycle": self._retries_this_cycle,
+                "max_retries_per_cycle": self.max_retries_per_cycle,
+            }
+
+    def join(self, timeout=None):
+        """Wait until every task finished; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+            return True
+
+    def pause(self):
+        """Hold tasks in the queue (this process is no longer the poller)"""
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+waiting_room_queue = WaitingRoomQueue()
+
 def waiting_room_worker():
-    """Background worker that processes waiting room tasks"""
+    """Pool worker: run due tasks, re-schedule retries instead of sleeping"""
     print("🚀 Waiting room worker started")
     while True:
+        task = waiting_room_queue.get()
+        if task is None:
+            break
+        
         try:
-            task = waiting_room_queue.get(timeout=1)
-            if task is None:  # Poison pill to stop worker
-                break
-            process_waiting_room_task(task)
-            waiting_room_queue.task_done()
-        except:
-            # Queue empty, keep waiting
-            continue
-
-def start_waiting_room_worker():
-    """Start the background worker thread"""
-    worker_thread = Thread(target=waiting_room_worker, daemon=True)
-    worker_thread.start()
-    print("✓ Waiting room worker thread started")
+            if task.attempts == 0:
+                print(f"🕐 Handling waiting room for {task.district_name} on {task.date}")
+            outcome = attempt_waiting_room_task(task)
+            task.last_outcome = outcome
+            
+            if outcome == DONE:
+                waiting_room_queue.task_done(task, "done")
+                continue
+            
+            if outcome == RETRY_CIRCUIT_OPEN:
+                # Nothing was sent - wait for the breaker's next probe
+                waiting_room_queue.reschedule(task, max(1.0, timeslot_breaker.retry_in()), count_retry=False)
+                continue
+            
+            if task.attempts < MAX_ATTEMPTS:
+                if waiting_room_queue.reschedule(task, RETRY_SECONDS):
+                    continue
+                print(f"⚠️ Waiting room retry budget for this cycle used up")
+            
+            give_up_waiting_room_task(task, outcome)
+            waiting_room_queue.task_done(task, "gave_up")
+        except Exception as e:
+            print(f"❌ Waiting room worker error for {task.district_name} on {task.date}: {e}")
+            traceback.print_exc()
+            waiting_room_queue.task_done(task, "error")
+
+_workers_started = False
+
+def start_waiting_room_worker(workers=WORKERS):
+    """Start the worker pool threads (once; later calls resume a paused queue)"""
+    global _workers_started
+    waiting_room_queue.resume()
+    if _workers_started:
+        return
+    _workers_started = True
+    for i in range(workers):
+        worker_thread = Thread(target=waiting_room_worker, name=f"waiting-room-{i}", daemon=True)
+        worker_thread.start()
+    print(f"✓ Waiting room worker pool started ({workers} threads)")
+
+def start_waiting_room_cycle():
+    """New check cycle - resets the retry budget"""
+    waiting_room_queue.start_cycle()
 
 def add_to_waiting_room_queue(district_name, code, date, url):
-    """Add a waiting room task to the queue"""
+    """Add a waiting room task to the queue (one per (district, date))"""
     task = WaitingRoomTask(district_name, code, date, url)
-    waiting_room_queue.put(task)
+    if not waiting_room_queue.put(task):
+        print(f"↩️  Waiting room task already pending, refreshed: {district_name} on {date}")
+        return
     queue_size = waiting_room_queue.qsize()
     print(f"➕ Added to waiting room queue: {district_name} on {date} (queue size: {queue_size})")
-    send_slack(f"⏳ Waiting room detected: {district_name} on {date}. Will retry 3x over 30 seconds.")
\ No newline at end of file
+    send_slack(
+        f"⏳ Waiting room detected: {district_name} on {date}. "
+        f"Will retry {MAX_ATTEMPTS}x over {(MAX_ATTEMPTS - 1) * RETRY_SECONDS:.0f} seconds."
+    )
\ No newline at end of file